@@ -0,0 +1,32 @@
+"""Added route data version
+
+Revision ID: 4271b77b3b00
+Revises: 95c7ab9bc4c7
+Create Date: 2026-10-18 11:33:10.894499
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4271b77b3b00'
+down_revision: Union[str, Sequence[str], None] = '95c7ab9bc4c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+data_versions = sa.table('data_versions', sa.column('kind', sa.String), sa.column('version', sa.Integer))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # bumped by every route write, the graph snapshot stamp is taken from it
+    op.bulk_insert(data_versions, [{'kind': 'route', 'version': 0}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(data_versions.delete().where(data_versions.c.kind == 'route'))
@@ -0,0 +1,58 @@
+"""Unique station names in each city
+
+Revision ID: b228e3176f33
+Revises: e7ce766b76b4
+Create Date: 2026-10-18 11:03:55.677303
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b228e3176f33'
+down_revision: Union[str, Sequence[str], None] = 'e7ce766b76b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# the lowest id of each (city_id, name) group is the station that is kept
+KEPT_IDS = "SELECT MIN(id) FROM stations GROUP BY city_id, name"
+
+
+def merge_station_column(column):
+    # points routes at a duplicate station to the kept station with the same city and name
+    op.execute(f"""
+        UPDATE routes SET {column} = (
+            SELECT MIN(kept.id) FROM stations duplicate
+            JOIN stations kept ON kept.city_id = duplicate.city_id AND kept.name = duplicate.name
+            WHERE duplicate.id = routes.{column}
+        )
+        WHERE {column} NOT IN ({KEPT_IDS})
+    """)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the upload scripts created some stations more than once, so the duplicates
+    # are merged into one station before the constraint can be added
+    merge_station_column("origin_station_id")
+    merge_station_column("destination_station_id")
+    op.execute(f"DELETE FROM stations WHERE id NOT IN ({KEPT_IDS})")
+
+    # sqlite can't add a constraint to an existing table, batch mode copies the table there
+    with op.batch_alter_table('stations') as batch_op:
+        batch_op.create_unique_constraint('uq_stations_city_id_name', ['city_id', 'name'])
+
+    # the constraint's (city_id, name) index covers lookups by city, so this one is redundant
+    op.drop_index(op.f('ix_stations_city_id'), table_name='stations')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_stations_city_id'), 'stations', ['city_id'], unique=False)
+    # merged stations stay merged, only the constraint is removed
+    with op.batch_alter_table('stations') as batch_op:
+        batch_op.drop_constraint('uq_stations_city_id_name', type_='unique')
@@ -2,10 +2,35 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # read replica the read only endpoints use, empty to read from DATABASE_URL too
+    DATABASE_READ_URL: str = ""
+    # connection pool for each engine
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30 # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800 # seconds before a connection is replaced, -1 to keep them
+    DB_POOL_PRE_PING: bool = True # check a connection still works before using it
 
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: str
+
+    # "dict" keeps the adjacency list of edge dicts, "csr" also builds the compact array layout
+    GRAPH_LAYOUT: str = "dict"
+    # binary snapshot of the graph reused on startup while the database hasn't changed, empty to disable
+    GRAPH_SNAPSHOT_PATH: str = "graph_snapshot.bin"
+    # name of the shared memory blocks every worker searches one copy of the graph in when
+    # running several workers, empty to disable
+    GRAPH_SHARED_MEMORY: str = ""
+    # where the precomputed all pairs fare table is saved between restarts
+    FARE_TABLE_PATH: str = "fare_table.json"
+    # search used for live journey searches, "dijkstra", "astar", "bidirectional" or "matrix"
+    JOURNEY_ALGORITHM: str = "dijkstra"
+    # journey result cache, size in entries and time to live in seconds
+    JOURNEY_CACHE_SIZE: int = 1024
+    JOURNEY_CACHE_TTL: int = 300
+    # seconds clients may reuse /journeys, /city and /transport_mode responses before revalidating with their ETag
+    HTTP_CACHE_MAX_AGE: int = 60
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
\ No newline at end of file
@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
+from .utils.pool_metrics import MeteredQueuePool, MeteredAsyncQueuePool
 
 """
 This file handles creatnig the actual connection to the database.
@@ -9,6 +11,23 @@ We will use sqlite3 database in development, but postgres in production.
 Therefore we use config.py to get the database URL from .env
 """
 
+
+def pool_options(url, poolclass):
+    """
+    Pool settings from Settings. An in memory sqlite database only exists on
+    the one connection, so it keeps sqlalchemy's default pool for that
+    """
+    if url.startswith("sqlite") and (url.endswith(":memory:") or url.rstrip("/").endswith("sqlite:")):
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 # when using sqlite3 'check_same_thread' is set to False 
 connect_args = {}
 if settings.DATABASE_URL.startswith("sqlite"):
@@ -16,7 +35,8 @@ if settings.DATABASE_URL.startswith("sqlite"):
 
 engine = create_engine(
     settings.DATABASE_URL, 
-    connect_args=connect_args
+    connect_args=connect_args,
+    **pool_options(settings.DATABASE_URL, MeteredQueuePool)
 )
 
 # factory for sessions. Each request gets its own database sesssion
@@ -24,9 +44,47 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+
+def async_database_url(url):
+    """
+    Turns DATABASE_URL into the same database with an async driver,
+    aiosqlite for sqlite and asyncpg for postgres
+    """
+    if url.startswith("sqlite"):
+        return url.replace("+pysqlite", "", 1).replace("sqlite://", "sqlite+aiosqlite://", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            # asyncpg calls the psycopg2 sslmode option ssl
+            return "postgresql+asyncpg://" + url[len(prefix):].replace("sslmode=", "ssl=")
+    return url
+
+def create_async_pool_engine(url):
+    return create_async_engine(async_database_url(url), **pool_options(url, MeteredAsyncQueuePool))
+
+# the endpoints use these engines, so waiting on the database doesn't tie up a thread.
+# the blocking engine above is still used on startup and for the graph reload.
+# writes go to the primary, reads go to the replica when one is configured
+async_engine = create_async_pool_engine(settings.DATABASE_URL)
+if settings.DATABASE_READ_URL:
+    async_read_engine = create_async_pool_engine(settings.DATABASE_READ_URL)
+else:
+    async_read_engine = async_engine
+
+# expire_on_commit is off because async sessions can't lazy load an expired attribute
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
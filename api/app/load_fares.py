@@ -0,0 +1,187 @@
+import argparse
+import csv
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import create_engine, delete, insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .utils.bulk import chunks, upsert_insert
+from .utils.etags import bump_query
+
+"""
+Loads an extracted fares CSV (origin_city, destination_city, origin_station,
+destination_station, price) straight into the database, without going through the API.
+
+Cities, stations and the transport mode are looked up once and kept in memory, missing
+stations are created with one INSERT ... ON CONFLICT per batch, and the routes are
+streamed in with COPY on postgres or a single executemany on sqlite. Everything happens
+in one transaction, so a failed load leaves the database as it was.
+
+Usage (from the api directory):
+    python -m app.load_fares ../datasets/train-fares/extracted_fares2.csv --mode train --notes "Imported from Rail Fares Dataset"
+    python -m app.load_fares ../datasets/coach-fares/flix-bus/extracted_fares.csv --mode coach --notes "Flix Bus route" --replace
+
+A running server doesn't see the new routes until POST /admin/graph/reload is called,
+and the next start loads them from the database rather than the graph snapshot.
+"""
+
+COPY_BATCH_SIZE = 50000 # routes sent per COPY, so the CSV buffer stays small
+ROUTE_COLUMNS = ("price", "notes", "origin_station_id", "destination_station_id", "transport_mode_id")
+
+
+def read_fares(path, cities):
+    """
+    Yields (origin city id, origin station, destination city id, destination station, price)
+    for each usable row of the CSV, and prints why any row is skipped
+
+    :param path: CSV file
+    :param cities: lower case city name -> city id
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            origin_city = cities.get(row["origin_city"].lower().strip())
+            destination_city = cities.get(row["destination_city"].lower().strip())
+            if origin_city is None or destination_city is None:
+                missing = row["origin_city"] if origin_city is None else row["destination_city"]
+                print(f"Line {line}: skipping, city '{missing}' not found")
+                continue
+            try:
+                price = Decimal(row["price"]).quantize(Decimal("0.01"))
+            except InvalidOperation:
+                print(f"Line {line}: skipping, price '{row['price']}' is not a number")
+                continue
+            yield (
+                origin_city, row["origin_station"].lower().strip(),
+                destination_city, row["destination_station"].lower().strip(),
+                price,
+            )
+
+
+def resolve_stations(db, keys):
+    """
+    Returns (city_id, name) -> station id for every key, creating the stations that don't exist
+
+    :param db: Database session
+    :param keys: Set of (city_id, name)
+    """
+    stations = {
+        (city_id, name): station_id
+        for station_id, city_id, name in db.execute(select(models.Station.id, models.Station.city_id, models.Station.name))
+    }
+    missing = [key for key in keys if key not in stations]
+    for chunk in chunks(missing):
+        query = (
+            upsert_insert(db, models.Station)
+            .values([{"city_id": city_id, "name": name} for city_id, name in chunk])
+            .on_conflict_do_nothing(index_elements=["city_id", "name"])
+            .returning(models.Station.id, models.Station.city_id, models.Station.name)
+        )
+        for station_id, city_id, name in db.execute(query):
+            stations[(city_id, name)] = station_id
+
+    # RETURNING only gives back the rows this insert made, a station another writer
+    # created since the first select is looked up again
+    created = sum(key in stations for key in missing)
+    still_missing = [key for key in missing if key not in stations]
+    for chunk in chunks(still_missing):
+        query = select(models.Station.id, models.Station.city_id, models.Station.name).where(
+            tuple_(models.Station.city_id, models.Station.name).in_(chunk)
+        )
+        for station_id, city_id, name in db.execute(query):
+            stations[(city_id, name)] = station_id
+    return stations, created
+
+
+def copy_routes(db, routes):
+    """
+    Streams the routes into postgres with COPY FROM STDIN, in CSV batches
+    """
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        for chunk in chunks(routes, COPY_BATCH_SIZE):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                [route[column] for column in ROUTE_COLUMNS] for route in chunk
+            )
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY routes ({', '.join(ROUTE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def load_fares(db, path, mode_name, notes, replace=False):
+    """
+    Loads the fares CSV at path as routes of the given transport mode, returns the number of routes
+
+    :param db: Database session, the caller commits
+    :param path: CSV file
+    :param mode_name: Name of an existing transport mode, e.g. train
+    :param notes: Notes saved on every route
+    :param replace: Delete the mode's existing routes first
+    """
+    mode_id = db.scalar(select(models.TransportMode.id).where(models.TransportMode.name == mode_name.lower()))
+    if mode_id is None:
+        raise SystemExit(f"Transport mode '{mode_name}' not found")
+
+    start = time.perf_counter()
+    cities = {name.lower(): city_id for city_id, name in db.execute(select(models.City.id, models.City.name))}
+    fares = list(read_fares(path, cities))
+    print(f"Read {len(fares)} fares in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    keys = {(city_id, name) for fare in fares for city_id, name in (fare[0:2], fare[2:4])}
+    stations, created = resolve_stations(db, keys)
+    print(f"Resolved {len(keys)} stations ({created} new) in {time.perf_counter() - start:.2f}s")
+
+    if replace:
+        deleted = db.execute(delete(models.Route).where(models.Route.transport_mode_id == mode_id)).rowcount
+        print(f"Deleted {deleted} existing {mode_name} routes")
+
+    routes = [
+        {
+            "price": price,
+            "notes": notes,
+            "origin_station_id": stations[(origin_city, origin_station)],
+            "destination_station_id": stations[(destination_city, destination_station)],
+            "transport_mode_id": mode_id,
+        }
+        for origin_city, origin_station, destination_city, destination_station, price in fares
+    ]
+
+    start = time.perf_counter()
+    if db.bind.dialect.name == "postgresql":
+        copy_routes(db, routes)
+    else:
+        db.execute(insert(models.Route), routes)
+    # in the same transaction, so the graph snapshot is never reused after this load
+    db.execute(bump_query("route"))
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {len(routes)} routes in {elapsed:.2f}s ({len(routes) / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return len(routes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load an extracted fares CSV straight into the database")
+    parser.add_argument("csv", help="CSV with origin_city, destination_city, origin_station, destination_station, price")
+    parser.add_argument("--mode", required=True, help="transport mode of the routes, e.g. train or coach")
+    parser.add_argument("--notes", default=None, help="notes saved on every route")
+    parser.add_argument("--replace", action="store_true", help="delete the mode's existing routes first")
+    parser.add_argument("--url", default=settings.DATABASE_URL, help="database to load into, default DATABASE_URL")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    start = time.perf_counter()
+    with Session(engine) as db:
+        count = load_fares(db, args.csv, args.mode, args.notes, args.replace)
+        db.commit()
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {count} routes in {elapsed:.2f}s overall ({count / max(elapsed, 1e-9):,.0f} rows/sec)")
+    print("Call POST /admin/graph/reload so a running server picks them up")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 
-from .routers import routes, cities, stations, transport_modes, journeys, auth
+from .routers import routes, cities, stations, transport_modes, journeys, auth, admin
 from .database import SessionLocal
 from .utils.graph_manager import GraphManager
-from . import models
+from .utils.graph_loader import prepare_graph
 
 # on startup we load our graph of all routes into singleton class
 # this class will be used to avoid fetching all 30,000 routes from 
@@ -15,26 +15,24 @@ async def lifespan(app: FastAPI):
     gm = GraphManager()
     
     db: Session = SessionLocal()
-    try:        
-        db_routes = db.query(models.Route).options(
-            joinedload(models.Route.origin_station).joinedload(models.Station.city),
-            joinedload(models.Route.destination_station).joinedload(models.Station.city)
-        ).all()
-        
-        # build the graph
-        gm.build_graph(db_routes)
+    try:
+        prepare_graph(gm, db)
         
         # attach the graph manager class to app state
         # this allows us to access it in endpoints
         app.state.gm = gm
-        print(f"Graph loaded successfully with {len(db_routes)} routes.")
+        print(f"Graph loaded successfully with {len(gm.route_origins)} routes in {gm.build_seconds:.2f}s.")
     except Exception as e:
         print(f"Error loading graph: {e}")
     finally:
         db.close()
     
     yield
-    
+
+    # the last worker to stop removes the shared graph
+    if gm.shared is not None:
+        gm.shared.detach()
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -43,4 +41,5 @@ app.include_router(cities.router)
 app.include_router(stations.router)
 app.include_router(transport_modes.router)
 app.include_router(journeys.router)
-app.include_router(auth.router)
\ No newline at end of file
+app.include_router(auth.router)
+app.include_router(admin.router)
\ No newline at end of file
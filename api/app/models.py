@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -15,8 +15,13 @@ class Route(Base):
 
     # foreign keys
     origin_station_id = Column(Integer, ForeignKey("stations.id"), nullable=False)
-    destination_station_id = Column(Integer, ForeignKey("stations.id"), nullable=False)
-    transport_mode_id = Column(Integer, ForeignKey("transport_modes.id"), nullable=False)
+    destination_station_id = Column(Integer, ForeignKey("stations.id"), nullable=False, index=True)
+    transport_mode_id = Column(Integer, ForeignKey("transport_modes.id"), nullable=False, index=True)
+
+    # origin first, so it also serves lookups by origin station on its own
+    __table_args__ = (
+        Index("ix_routes_origin_destination", "origin_station_id", "destination_station_id"),
+    )
 
     # relationships
     origin_station = relationship("Station", foreign_keys=[origin_station_id], back_populates="routes_starting")
@@ -32,6 +37,12 @@ class Station(Base):
     # foreign keys
     city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
 
+    # a city can't have two stations with the same name, POST /stations/bulk_upsert relies on this.
+    # city_id comes first so the constraint's index also serves lookups by city
+    __table_args__ = (
+        UniqueConstraint("city_id", "name", name="uq_stations_city_id_name"),
+    )
+
     # relationships
     city = relationship("City", foreign_keys=[city_id], back_populates="stations")
     routes_starting = relationship("Route", foreign_keys="[Route.origin_station_id]", back_populates="origin_station")
@@ -41,7 +52,7 @@ class City(Base):
     __tablename__ = "cities"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)
     latitude = Column(Numeric(10, 6), nullable=False)
     longitude = Column(Numeric(10, 6), nullable=False)
 
@@ -53,4 +64,12 @@ class TransportMode(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
 
-    routes = relationship("Route", back_populates="transport_mode")
\ No newline at end of file
+    routes = relationship("Route", back_populates="transport_mode")
+# one row per kind of data (city, transport_mode, route) with a number bumped in the
+# same transaction as every write to it. The ETags on /city and /transport_mode and the
+# graph snapshot stamp are built from these, so every worker agrees on them
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    kind = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+
+from .. import schemas
+from ..database import SessionLocal, engine, async_engine, async_read_engine
+from ..utils.graph_manager import GraphManager
+from ..utils.graph_loader import prepare_graph
+from ..utils.verify_auth_token import validate_user_role
+from ..utils import etags
+from ..utils.pool_metrics import pool_stats
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(validate_user_role(["admin"]))]
+)
+
+# only one reload runs at a time, it is held from the request until the rebuild finishes
+_reload_lock = threading.Lock()
+_last_error = None
+
+
+def _rebuild_graph():
+    global _last_error
+    gm = GraphManager()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        prepare_graph(gm, db, reload=True)
+        # the reload is used after loading data straight into the database, so anything may have changed
+        db.execute(etags.bump_query())
+        db.commit()
+        _last_error = None
+        print(f"Graph reloaded with {len(gm.route_origins)} routes in {time.perf_counter() - started:.2f}s.")
+    except Exception as e:
+        _last_error = str(e)
+        print(f"Error reloading graph: {e}")
+    finally:
+        db.close()
+        _reload_lock.release()
+
+
+def _graph_status():
+    gm = GraphManager()
+    return {
+        "is_loaded": gm.is_loaded,
+        "version": gm.version,
+        "last_updated": gm.last_updated,
+        "build_seconds": gm.build_seconds,
+        "routes": len(gm.route_origins),
+        "rebuilding": _reload_lock.locked(),
+        "last_error": _last_error,
+    }
+
+
+@router.get("/graph", response_model=schemas.GraphStatusRead)
+def get_graph_status():
+    """
+    # Route graph status
+
+    Whether the in memory route graph is loaded, its version, when it last changed,
+    how long the last full load took and whether a reload is running.
+    """
+    return _graph_status()
+
+
+@router.post("/graph/reload", response_model=schemas.GraphStatusRead, status_code=202)
+def reload_graph(background_tasks: BackgroundTasks):
+    """
+    # Reload the route graph
+
+    Rebuilds the graph from the database in the background, e.g. after a bulk dataset load.
+    Journeys keep being served from the current graph until the new one is swapped in.
+    Poll `GET /admin/graph` to see when it has finished.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A graph reload is already running")
+
+    background_tasks.add_task(_rebuild_graph)
+    return _graph_status()
+
+
+@router.get("/db/pools")
+def get_pool_stats():
+    """
+    # Database connection pools
+
+    Occupancy (connections checked out, idle and in overflow) and how long checkouts have
+    waited for a connection, for the primary and read replica engines used by the endpoints
+    and the blocking engine used to load the graph.
+    """
+    pools = {"primary": pool_stats(async_engine)}
+    if async_read_engine is not async_engine:
+        pools["replica"] = pool_stats(async_read_engine)
+    pools["graph_loader"] = pool_stats(engine)
+    return pools
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from ..database import get_db
+from ..database import get_async_db, get_async_read_db
 from .. import models, schemas
 from ..utils.verify_auth_token import validate_user_role
+from ..utils import etags
+from ..utils.pagination import MAX_LIMIT, keyset_page, ndjson_response, set_next_link, wants_ndjson
 
 
 # create a router for routes to do with the City model
@@ -15,7 +18,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.CityRead, status_code=201)
-def create_new_city(city: schemas.CityCreate, db: Session = Depends(get_db)):
+async def create_new_city(city: schemas.CityCreate, db: AsyncSession = Depends(get_async_db)):
     """
     # Add a new city 
 
@@ -26,34 +29,64 @@ def create_new_city(city: schemas.CityCreate, db: Session = Depends(get_db)):
     """
     db_city = models.City(**city.model_dump())
     db.add(db_city)
-    db.commit()
-    db.refresh(db_city)
+    await etags.bump(db, "city")
+    await db.commit()
+    await db.refresh(db_city)
     return db_city
 
 @router.get("/", response_model=List[schemas.CityRead])
-def get_all_cities(db: Session = Depends(get_db)):
+async def get_all_cities(
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
    # Get all cities
+
+   - **after_id** / **limit**: Optional page of cities with ids after `after_id`. A full page has a `Link` header to the next one.
+
+   Send `Accept: application/x-ndjson` to stream the cities one per line instead.
+   Sends an ETag, repeat the request with `If-None-Match` to get a 304 if nothing has changed.
     """
-    return db.query(models.City).all()
+    ndjson = wants_ndjson(request)
+    response.headers["Vary"] = "Accept"
+    cached = etags.not_modified(request, response, etags.make_etag(await etags.data_version(db, "city"), int(ndjson)))
+    if cached:
+        return cached
+
+    query = keyset_page(select(models.City), models.City.id, after_id, limit)
+    if ndjson:
+        return ndjson_response(query, schemas.CityRead, headers=dict(response.headers))
+
+    cities = (await db.scalars(query)).all()
+    set_next_link(request, response, cities, limit)
+    return cities
 
 @router.get("/id/{city_id}", response_model=schemas.CityRead)
-def get_city_by_id(city_id: int, db: Session = Depends(get_db)):
+async def get_city_by_id(city_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
     """
     # Get a city by ID
     """
-    city = db.query(models.City).filter(models.City.id == city_id).first()
+    cached = etags.not_modified(request, response, etags.make_etag(await etags.data_version(db, "city")))
+    if cached:
+        return cached
+    city = await db.get(models.City, city_id)
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
     return city
 
 @router.get("/name/{city_name}", response_model=schemas.CityRead)
-def get_city_by_name(city_name: str, db: Session = Depends(get_db)):
+async def get_city_by_name(city_name: str, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
     """
     # Get a city by its name
     """
+    cached = etags.not_modified(request, response, etags.make_etag(await etags.data_version(db, "city")))
+    if cached:
+        return cached
     city_name = city_name.lower()
-    city = db.query(models.City).filter(models.City.name == city_name).first()
+    city = (await db.scalars(select(models.City).where(models.City.name == city_name))).first()
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
     return city
\ No newline at end of file
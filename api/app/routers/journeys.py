@@ -1,36 +1,300 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from decimal import Decimal
 
-from ..database import get_db
+from ..database import get_async_read_db
 from .. import models, schemas
 from ..utils.graph_manager import GraphManager
-from ..utils.journey_finder import find_cheapest_path
-from ..utils.verify_auth_token import get_current_user
+from ..utils.journey_finder import (
+    find_cheapest_path, shortest_path_tree, reverse_shortest_path_tree, unwind_path, follow_path
+)
+from ..utils.k_shortest import find_k_cheapest_paths
+from ..utils.pareto import find_pareto_paths
+from ..utils.journey_cache import JourneyCache, NOT_CACHED
+from ..utils.verify_auth_token import get_current_user, validate_user_role
+from ..utils import etags
+from .routes import ROUTE_DETAILS
+from ..config import settings
+
+def sync_shared_graph():
+    """
+    When workers share the graph, picks up any newer graph another worker has published
+    """
+    gm = GraphManager()
+    if gm.shared is not None:
+        gm.shared.sync(gm)
 
 router = APIRouter(
     prefix="/journeys",
-    tags=["Journeys"]
+    tags=["Journeys"],
+    dependencies=[Depends(sync_shared_graph)]
 )
 
+# results of recent searches, keyed on (origin, destination, modes, graph version)
+journey_cache = JourneyCache(maxsize=settings.JOURNEY_CACHE_SIZE, ttl=settings.JOURNEY_CACHE_TTL)
+
 @router.get("/", response_model=schemas.JourneyRead, status_code=200)
-def get_journey(origin_id: int, destination_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    
+async def get_journey(
+    origin_id: int,
+    destination_id: int,
+    request: Request,
+    response: Response,
+    allowed_modes: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    # Cheapest journey between two cities
+
+    - **allowed_modes**: Optional transport modes to travel by, e.g. `?allowed_modes=train`. Repeat it to allow several.
+
+    Sends an ETag, repeat the request with `If-None-Match` to get a 304 if the routes haven't changed.
+    """
     graph_manager = GraphManager() # gets us our instance of our singleton class
+
+    # the legs come from the route catalogue, which only changes along with the graph, so
+    # the tag is a hash of both. Every worker serving the same routes hands out the same
+    # tag, and it still matches after a restart
+    etag = etags.make_etag(graph_manager.state.digest())
+    cached = etags.not_modified(request, response, etag)
+    if cached:
+        return cached
+    modes = frozenset(mode.lower() for mode in allowed_modes) if allowed_modes else None
     
+    # answer from the precomputed fare table (which covers every mode), unless the graph has changed since it was built
+    fare_table = graph_manager.fare_table
+    if modes is None and fare_table is not None and fare_table.is_fresh(graph_manager):
+        cheapest_path = fare_table.lookup(origin_id, destination_id)
+    else:
+        # otherwise reuse a recent live search for the same graph version
+        cache_key = (origin_id, destination_id, modes, graph_manager.version)
+        cheapest_path = journey_cache.get(cache_key, NOT_CACHED)
+        if cheapest_path is NOT_CACHED:
+            # the search is CPU bound, so it runs in the threadpool rather than holding up the event loop
+            cheapest_path = await run_in_threadpool(
+                find_cheapest_path, graph_manager, origin_id, destination_id, settings.JOURNEY_ALGORITHM, modes
+            )
+            journey_cache.set(cache_key, cheapest_path)
 
-    cheapest_path = find_cheapest_path(graph_manager, origin_id, destination_id)
     if not cheapest_path:
         raise HTTPException(status_code=404, detail="No journey found")
     
-    # now need to get all the paths from the db in order
+    return {
+        "total_price": cheapest_path['total_price'],
+        "path": await _load_routes(db, cheapest_path["route_ids"])
+    }
+
+
+async def _load_routes(db, route_ids):
+    # fill in each leg from the in memory catalogue, only going to the
+    # db for a route it doesn't have yet (e.g. one written by another worker)
+    catalogue = GraphManager().catalogue
     all_routes = []
-    for route_id in cheapest_path["route_ids"]:
-        route = db.query(models.Route).filter(models.Route.id == route_id).first()
+    for route_id in route_ids:
+        route = catalogue.route(route_id) if catalogue is not None else None
+        if route is None:
+            route = (await db.scalars(
+                select(models.Route).options(*ROUTE_DETAILS).where(models.Route.id == route_id)
+            )).first()
+            if route is not None and catalogue is not None:
+                catalogue.put_route(route)
         all_routes.append(route)
+    return all_routes
+
+
+@router.get("/alternatives", response_model=List[schemas.JourneyRead], status_code=200)
+async def get_journey_alternatives(
+    origin_id: int,
+    destination_id: int,
+    k: int = Query(3, ge=1, le=10),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    # Cheapest alternative journeys
+
+    - **k**: How many journeys to return (1-10).
+
+    Returns up to k journeys between the two cities, cheapest first. The first is the cheapest
+    journey and the rest are the next cheapest ways to make the trip without visiting a city twice.
+    """
+    journeys = await run_in_threadpool(find_k_cheapest_paths, GraphManager(), origin_id, destination_id, k)
+    if not journeys:
+        raise HTTPException(status_code=404, detail="No journey found")
+
+    return [
+        {
+            "total_price": journey["total_price"],
+            "path": await _load_routes(db, journey["route_ids"])
+        }
+        for journey in journeys
+    ]
+
+
+@router.post("/matrix", response_model=schemas.JourneyMatrixRead, status_code=200)
+def get_journey_matrix(request: schemas.JourneyMatrixRequest, current_user = Depends(get_current_user)):
+    """
+    # Fare matrix between several origins and destinations
+
+    - **origin_ids**: City IDs to travel from.
+    - **destination_ids**: City IDs to travel to.
+
+    Returns the cheapest price and the route IDs taken for every origin/destination pair.
+    One search is run per distinct origin and reused for all of its destinations, so this is
+    far cheaper than calling `GET /journeys/` for every pair. Pairs with no journey are `null`,
+    and an origin paired with itself costs 0 with no routes.
+    """
+    graph_manager = GraphManager()
+    fare_table = graph_manager.fare_table
+    use_table = fare_table is not None and fare_table.is_fresh(graph_manager)
+
+    prices = []
+    route_ids = []
+    trees = {}
+    for origin_id in request.origin_ids:
+        if origin_id not in trees:
+            if use_table:
+                trees[origin_id] = (fare_table.costs.get(origin_id, {}), fare_table.predecessors.get(origin_id, {}))
+            else:
+                trees[origin_id] = shortest_path_tree(graph_manager, origin_id)
+        costs, predecessors = trees[origin_id]
+
+        price_row = []
+        route_row = []
+        for destination_id in request.destination_ids:
+            if destination_id == origin_id:
+                price_row.append(Decimal("0"))
+                route_row.append([])
+            elif destination_id in costs:
+                price_row.append(round(Decimal(costs[destination_id] - 5), 2)) # remove the first station fee
+                route_row.append(unwind_path(predecessors, origin_id, destination_id))
+            else:
+                price_row.append(None)
+                route_row.append(None)
+        prices.append(price_row)
+        route_ids.append(route_row)
 
     return {
-        "total_price": cheapest_path['total_price'],
-        "path": all_routes
+        "origin_ids": request.origin_ids,
+        "destination_ids": request.destination_ids,
+        "prices": prices,
+        "route_ids": route_ids
     }
-    
\ No newline at end of file
+
+
+@router.get("/pareto", response_model=List[schemas.JourneyOptionRead], status_code=200)
+async def get_pareto_journeys(
+    origin_id: int,
+    destination_id: int,
+    max_changes: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    # Trade off price against changes
+
+    - **max_changes**: Optional cap on the number of changes.
+
+    Returns every journey where no other journey is both cheaper and has fewer changes,
+    fewest changes first. Prices here are the plain sum of the route fares.
+    """
+    journeys = await run_in_threadpool(find_pareto_paths, GraphManager(), origin_id, destination_id, max_changes)
+    if not journeys:
+        raise HTTPException(status_code=404, detail="No journey found")
+
+    return [
+        {
+            "total_price": round(Decimal(journey["total_price"]), 2),
+            "changes": journey["changes"],
+            "path": await _load_routes(db, journey["route_ids"])
+        }
+        for journey in journeys
+    ]
+
+
+def _fresh_fare_table(graph_manager):
+    fare_table = graph_manager.fare_table
+    if fare_table is not None and fare_table.is_fresh(graph_manager):
+        return fare_table
+    return None
+
+
+def _reachable_cities(city_id, costs, max_price, path_to):
+    """
+    Turns a costs dict from a one to all search into a list sorted by price, leaving out
+    city_id itself and anything over budget
+    """
+    reachable = []
+    for other_id, cost in costs.items():
+        price = cost - 5 # remove the first station fee
+        if other_id == city_id or (max_price is not None and price > max_price):
+            continue
+        reachable.append({
+            "city_id": other_id,
+            "total_price": round(Decimal(price), 2),
+            "route_ids": path_to(other_id)
+        })
+    reachable.sort(key=lambda r: (r["total_price"], r["city_id"]))
+    return reachable
+
+
+@router.get("/from/{city_id}", response_model=List[schemas.ReachableCityRead], status_code=200)
+def get_journeys_from(city_id: int, max_price: Optional[float] = Query(None, ge=0), current_user = Depends(get_current_user)):
+    """
+    # Everywhere you can go from a city
+
+    - **city_id**: City ID to travel from.
+    - **max_price**: Optional budget, only journeys costing at most this are returned.
+
+    Returns the cheapest journey to every reachable city, cheapest first. This is one search
+    which stops as soon as everything left costs more than the budget.
+    """
+    graph_manager = GraphManager()
+    fare_table = _fresh_fare_table(graph_manager)
+    if fare_table is not None:
+        costs = fare_table.costs.get(city_id, {})
+        predecessors = fare_table.predecessors.get(city_id, {})
+    else:
+        costs, predecessors = shortest_path_tree(graph_manager, city_id, max_price)
+
+    return _reachable_cities(city_id, costs, max_price, lambda dest: unwind_path(predecessors, city_id, dest))
+
+
+@router.get("/to/{city_id}", response_model=List[schemas.ReachableCityRead], status_code=200)
+def get_journeys_to(city_id: int, max_price: Optional[float] = Query(None, ge=0), current_user = Depends(get_current_user)):
+    """
+    # Everywhere you can come from to reach a city
+
+    - **city_id**: City ID to travel to.
+    - **max_price**: Optional budget, only journeys costing at most this are returned.
+
+    Returns the cheapest journey from every city that can reach this one, cheapest first.
+    This is one search growing backwards from the city, stopping once everything left is over budget.
+    """
+    graph_manager = GraphManager()
+    fare_table = _fresh_fare_table(graph_manager)
+    if fare_table is not None:
+        # read the column for this destination out of every origin's row
+        costs = {
+            origin: origin_costs[city_id]
+            for origin, origin_costs in fare_table.costs.items() if city_id in origin_costs
+        }
+        path_to = lambda origin: unwind_path(fare_table.predecessors[origin], origin, city_id)
+    else:
+        costs, successors, departures = reverse_shortest_path_tree(graph_manager, city_id, max_price)
+        path_to = lambda origin: follow_path(successors, departures, origin, city_id)
+
+    return _reachable_cities(city_id, costs, max_price, path_to)
+
+
+@router.get("/cache", dependencies=[Depends(validate_user_role(["admin"]))])
+def get_journey_cache_stats():
+    """
+    # Journey cache statistics
+
+    Hit, miss and eviction counters for the journey result cache, plus the current graph version.
+    """
+    return {**journey_cache.stats(), "graph_version": GraphManager().version}
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 
-from ..database import get_db
+from ..database import get_async_db, get_async_read_db
 from .. import models, schemas
 from ..utils.verify_auth_token import validate_user_role
+from ..utils import etags
+from ..utils.bulk import chunks, existing_ids
+from ..utils.graph_manager import GraphManager
+from ..utils.pagination import MAX_LIMIT, keyset_page, ndjson_response, set_next_link, wants_ndjson
 
 # create a router - similar to a mini-app for endpoints to do with 
 # routes between cities
@@ -14,8 +21,56 @@ router = APIRouter(
     dependencies=[Depends(validate_user_role(["admin"]))]
 )
 
+MAX_BULK_ROUTES = 20000
+
+# async sessions can't lazy load, so everything RouteRead (and the graph) needs is loaded up front
+ROUTE_DETAILS = (
+    selectinload(models.Route.origin_station).selectinload(models.Station.city),
+    selectinload(models.Route.destination_station).selectinload(models.Station.city),
+    selectinload(models.Route.transport_mode),
+)
+
+def filter_routes(
+    query,
+    origin_city_id=None,
+    destination_city_id=None,
+    origin_station_id=None,
+    destination_station_id=None,
+    transport_mode_id=None,
+    min_price=None,
+    max_price=None
+):
+    """
+    Adds the GET /routes/ filters to a select() of routes. Each one is answered from an index,
+    city filters go through stations.city_id and then the origin/destination index on routes.
+    """
+    if origin_city_id is not None:
+        query = query.where(models.Route.origin_station_id.in_(
+            select(models.Station.id).where(models.Station.city_id == origin_city_id)
+        ))
+    if destination_city_id is not None:
+        query = query.where(models.Route.destination_station_id.in_(
+            select(models.Station.id).where(models.Station.city_id == destination_city_id)
+        ))
+    if origin_station_id is not None:
+        query = query.where(models.Route.origin_station_id == origin_station_id)
+    if destination_station_id is not None:
+        query = query.where(models.Route.destination_station_id == destination_station_id)
+    if transport_mode_id is not None:
+        query = query.where(models.Route.transport_mode_id == transport_mode_id)
+    if min_price is not None:
+        query = query.where(models.Route.price >= min_price)
+    if max_price is not None:
+        query = query.where(models.Route.price <= max_price)
+    return query
+
+async def _get_route(db, route_id):
+    # populate_existing reloads the relationships of a route the session already holds
+    query = select(models.Route).options(*ROUTE_DETAILS).where(models.Route.id == route_id)
+    return (await db.scalars(query.execution_options(populate_existing=True))).first()
+
 @router.post("/", response_model=schemas.RouteRead, status_code=201)
-def create_new_route(route: schemas.RouteCreate, db: Session = Depends(get_db)):
+async def create_new_route(route: schemas.RouteCreate, db: AsyncSession = Depends(get_async_db)):
     """
     # Create a new travel route
 
@@ -28,9 +83,9 @@ def create_new_route(route: schemas.RouteCreate, db: Session = Depends(get_db)):
     """
 
     # check if the start and end stations exist
-    origin_station = db.query(models.Station).filter(models.Station.id == route.origin_station_id).first()
-    destination_station = db.query(models.Station).filter(models.Station.id == route.destination_station_id).first()
-    transport_mode = db.query(models.TransportMode).filter(models.TransportMode.id == route.transport_mode_id).first()
+    origin_station = await db.get(models.Station, route.origin_station_id)
+    destination_station = await db.get(models.Station, route.destination_station_id)
+    transport_mode = await db.get(models.TransportMode, route.transport_mode_id)
 
     if not origin_station:
         raise HTTPException(status_code=404, detail="Origin station not found") 
@@ -41,28 +96,113 @@ def create_new_route(route: schemas.RouteCreate, db: Session = Depends(get_db)):
 
     db_route = models.Route(**route.model_dump())
     db.add(db_route)
-    db.commit()
-    db.refresh(db_route)
+    await etags.bump(db, "route")
+    await db.commit()
+    db_route = await _get_route(db, db_route.id)
+    # add the route to the in memory graph so /journeys can use it straight away.
+    # it can rebuild the CSR arrays so it runs off the event loop
+    await run_in_threadpool(GraphManager().add_edge, db_route)
     return db_route
 
+@router.post("/bulk", response_model=schemas.RouteBulkResult)
+async def create_routes_in_bulk(
+    routes: List[schemas.RouteCreate] = Body(..., max_length=MAX_BULK_ROUTES),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    # Create many travel routes at once
+
+    Takes a list of up to 20,000 routes in the same format as `POST /routes/`. The stations and
+    transport modes are checked with a couple of queries for the whole list, and every valid
+    route is inserted in one transaction. Routes referring to a station or transport mode that
+    doesn't exist are skipped and listed in `errors` with their position in the list.
+
+    Returns the ids of the created routes in the order they were sent.
+    """
+    station_ids = {route.origin_station_id for route in routes} | {route.destination_station_id for route in routes}
+    stations = await existing_ids(db, models.Station.id, station_ids)
+    modes = await existing_ids(db, models.TransportMode.id, {route.transport_mode_id for route in routes})
+
+    rows = []
+    errors = []
+    for index, route in enumerate(routes):
+        if route.origin_station_id not in stations:
+            errors.append(schemas.BulkError(index=index, detail="Origin station not found"))
+        elif route.destination_station_id not in stations:
+            errors.append(schemas.BulkError(index=index, detail="Destination Station not found"))
+        elif route.transport_mode_id not in modes:
+            errors.append(schemas.BulkError(index=index, detail="Transport Mode not found"))
+        else:
+            rows.append(route.model_dump())
+
+    if not rows:
+        return schemas.RouteBulkResult(created=[], errors=errors)
+
+    # one executemany insert, RETURNING the new ids in the same order as the rows
+    query = insert(models.Route).returning(models.Route.id, sort_by_parameter_order=True)
+    created = list(await db.scalars(query, rows))
+    await etags.bump(db, "route")
+    await db.commit()
+
+    # load the new routes with their details and add them to the graph as one change
+    new_routes = []
+    for chunk in chunks(created):
+        new_routes.extend(await db.scalars(select(models.Route).options(*ROUTE_DETAILS).where(models.Route.id.in_(chunk))))
+    await run_in_threadpool(GraphManager().add_edges, new_routes)
+
+    return schemas.RouteBulkResult(created=created, errors=errors)
+
 @router.get("/", response_model=List[schemas.RouteRead])
-def get_all_routes(db: Session = Depends(get_db)):
+async def get_all_routes(
+    request: Request,
+    response: Response,
+    origin_city_id: Optional[int] = None,
+    destination_city_id: Optional[int] = None,
+    origin_station_id: Optional[int] = None,
+    destination_station_id: Optional[int] = None,
+    transport_mode_id: Optional[int] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    after_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
     # List all travel routes
 
     Returns a comprehensive list of all routes, including nested station and city details.
+
+    - **origin_city_id** / **destination_city_id**: Only routes leaving from / arriving at a station in this city.
+    - **origin_station_id** / **destination_station_id**: Only routes leaving from / arriving at this station.
+    - **transport_mode_id**: Only routes using this transport mode.
+    - **min_price** / **max_price**: Only routes within this price range.
+    - **after_id** / **limit**: Optional page of routes with ids after `after_id`. A full page has a `Link` header to the next one.
+
+    With ~30,000 routes, send `Accept: application/x-ndjson` to stream them one per line
+    instead of building the whole list first.
     """
-    return db.query(models.Route).all()
+    query = filter_routes(
+        select(models.Route).options(*ROUTE_DETAILS),
+        origin_city_id, destination_city_id, origin_station_id, destination_station_id,
+        transport_mode_id, min_price, max_price
+    )
+    query = keyset_page(query, models.Route.id, after_id, limit)
+    if wants_ndjson(request):
+        return ndjson_response(query, schemas.RouteRead)
+
+    routes = (await db.scalars(query)).all()
+    set_next_link(request, response, routes, limit)
+    return routes
 
 @router.get("/{route_id}", response_model=schemas.RouteRead)
-def get_route_by_id(route_id: int, db: Session = Depends(get_db)):
+async def get_route_by_id(route_id: int, db: AsyncSession = Depends(get_async_read_db)):
     """
     # Get specific route details
 
     Retrieves full information for a single route by its unique ID. 
     Returns a **404 error** if the ID is invalid.
     """
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
+    route = await _get_route(db, route_id)
 
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
@@ -70,39 +210,41 @@ def get_route_by_id(route_id: int, db: Session = Depends(get_db)):
     return route
 
 @router.delete("/{route_id}", status_code=204)
-def delete_route(route_id: int, db: Session = Depends(get_db)):
+async def delete_route(route_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     # Delete a route
 
     Permanently removes a route record. 
     *Note: This does not delete the associated stations or cities.*
     """
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
+    route = await db.get(models.Route, route_id)
     
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
-    db.delete(route)
-    db.commit()
+    await db.delete(route)
+    await etags.bump(db, "route")
+    await db.commit()
+    await run_in_threadpool(GraphManager().remove_edge, route_id)
     return None
 
 @router.put("/{route_id}", response_model=schemas.RouteRead, status_code=200)
-def update_route(route_id: int, route_update: schemas.RouteCreate, db: Session = Depends(get_db)):
+async def update_route(route_id: int, route_update: schemas.RouteCreate, db: AsyncSession = Depends(get_async_db)):
     """
     # Update an entire route 
 
     Replaces the route's data with the new values provided. 
     Checks for the existence of related stations and transport modes before saving.
     """
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
+    route = await db.get(models.Route, route_id)
     
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
     # Verify related entities exist
-    origin_station = db.query(models.Station).filter(models.Station.id == route_update.origin_station_id).first()
-    destination_station = db.query(models.Station).filter(models.Station.id == route_update.destination_station_id).first()
-    transport_mode = db.query(models.TransportMode).filter(models.TransportMode.id == route_update.transport_mode_id).first()
+    origin_station = await db.get(models.Station, route_update.origin_station_id)
+    destination_station = await db.get(models.Station, route_update.destination_station_id)
+    transport_mode = await db.get(models.TransportMode, route_update.transport_mode_id)
     
     if not origin_station or not destination_station or not transport_mode:
         raise HTTPException(status_code=404, detail="Invalid station or transport mode")
@@ -111,6 +253,9 @@ def update_route(route_id: int, route_update: schemas.RouteCreate, db: Session =
     for key, value in route_update.model_dump().items():
         setattr(route, key, value)
     
-    db.commit()
-    db.refresh(route)
-    return route
\ No newline at end of file
+    await etags.bump(db, "route")
+    await db.commit()
+    # the relationships still point at the old stations, so load them again
+    route = await _get_route(db, route_id)
+    await run_in_threadpool(GraphManager().update_edge, route)
+    return route
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 
-from ..database import get_db
+from ..database import get_async_db, get_async_read_db
 from .. import models, schemas
 from ..utils.verify_auth_token import validate_user_role
+from ..utils.bulk import chunks, existing_ids, upsert_insert
+from ..utils.pagination import MAX_LIMIT, keyset_page, ndjson_response, set_next_link, wants_ndjson
 
 router = APIRouter(
     prefix="/stations",
@@ -12,13 +17,15 @@ router = APIRouter(
     dependencies=[Depends(validate_user_role(["admin"]))]
 )
 
+MAX_BULK_STATIONS = 5000
+
 @router.post("/", response_model=schemas.StationRead, status_code=201)
-def create_new_station(station: schemas.StationCreate, db: Session = Depends(get_db)):
+async def create_new_station(station: schemas.StationCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Create a new Station
     """
     # check the city exists
-    city = db.query(models.City).filter(models.City.id == station.city_id).first()
+    city = await db.get(models.City, station.city_id)
 
     # if not send a 404 error
     if not city:
@@ -30,25 +37,112 @@ def create_new_station(station: schemas.StationCreate, db: Session = Depends(get
     # city does exist so can make the station
     db_station = models.Station(**station.model_dump())
     db.add(db_station)
-    db.commit()
-    db.refresh(db_station)
-    return db_station
+    try:
+        await db.commit()
+    except IntegrityError:
+        # (city_id, name) is unique
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"City with id {station.city_id} already has a station called {station.name}."
+        )
+    return await _get_station(db, db_station.id)
+
+@router.post("/bulk_upsert", response_model=schemas.StationBulkResult)
+async def upsert_stations_in_bulk(
+    stations: List[schemas.StationCreate] = Body(..., max_length=MAX_BULK_STATIONS),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get or create many stations at once
+
+    Takes a list of up to 5,000 stations. Each one that doesn't exist yet (by city and name) is
+    created, using INSERT ... ON CONFLICT DO NOTHING so two uploads running at once can't make
+    the same station twice. Returns one entry per station sent, in the same order, with its id
+    and whether it was created. Stations in a city that doesn't exist are listed in `errors`
+    and their entry is null.
+    """
+    cities = await existing_ids(db, models.City.id, {station.city_id for station in stations})
+
+    errors = []
+    keys = {} # (city_id, name) -> station id, dict keeps them in request order without repeats
+    for index, station in enumerate(stations):
+        if station.city_id not in cities:
+            errors.append(schemas.BulkError(index=index, detail=f"City with id {station.city_id} does not exist."))
+        else:
+            keys[(station.city_id, station.name)] = None
+
+    # insert the new stations, RETURNING only gives back the rows that were inserted
+    created = set()
+    for chunk in chunks(keys):
+        query = (
+            upsert_insert(db, models.Station)
+            .values([{"city_id": city_id, "name": name} for city_id, name in chunk])
+            .on_conflict_do_nothing(index_elements=["city_id", "name"])
+            .returning(models.Station.id, models.Station.city_id, models.Station.name)
+        )
+        for station_id, city_id, name in await db.execute(query):
+            keys[(city_id, name)] = station_id
+            created.add((city_id, name))
+
+    # then look up the ones that already existed
+    existing = [key for key, station_id in keys.items() if station_id is None]
+    for chunk in chunks(existing):
+        query = select(models.Station.id, models.Station.city_id, models.Station.name).where(
+            tuple_(models.Station.city_id, models.Station.name).in_(chunk)
+        )
+        for station_id, city_id, name in await db.execute(query):
+            keys[(city_id, name)] = station_id
+    await db.commit()
+
+    results = []
+    for station in stations:
+        key = (station.city_id, station.name)
+        if keys.get(key) is None:
+            results.append(None)
+        else:
+            results.append(schemas.StationUpsertRead(id=keys[key], city_id=station.city_id, name=station.name, created=key in created))
+            # a station repeated in the request was only created by its first entry
+            created.discard(key)
+    return schemas.StationBulkResult(stations=results, errors=errors)
 
 @router.get("/", response_model=List[schemas.StationRead])
-def get_all_stations(db: Session = Depends(get_db)):
+async def get_all_stations(
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
     Get all stations
+
+    - **after_id** / **limit**: Optional page of stations with ids after `after_id`. A full page has a `Link` header to the next one.
+
+    Send `Accept: application/x-ndjson` to stream the stations one per line instead.
     """
-    return db.query(models.Station).all()
+    query = keyset_page(select(models.Station).options(selectinload(models.Station.city)), models.Station.id, after_id, limit)
+    if wants_ndjson(request):
+        return ndjson_response(query, schemas.StationRead)
+
+    stations = (await db.scalars(query)).all()
+    set_next_link(request, response, stations, limit)
+    return stations
 
 @router.get("/{station_id}", response_model=schemas.StationRead)
-def get_station_by_id(station_id: int, db: Session = Depends(get_db)):
+async def get_station_by_id(station_id: int, db: AsyncSession = Depends(get_async_read_db)):
     """
     Get station by ID
     """
-    station = db.query(models.Station).filter(models.City.id == station_id).first()
+    station = await _get_station(db, station_id)
 
     if not station:
         raise HTTPException(status_code=404, detail="Station not found")
     
-    return station
\ No newline at end of file
+    return station
+
+
+async def _get_station(db, station_id):
+    # async sessions can't lazy load, so the city StationRead includes is loaded up front
+    return (await db.scalars(
+        select(models.Station).options(selectinload(models.Station.city)).where(models.Station.id == station_id)
+    )).first()
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from ..database import get_db
+from ..database import get_async_db, get_async_read_db
 from .. import models, schemas
 from ..utils.verify_auth_token import validate_user_role
+from ..utils import etags
 
 router = APIRouter(
     prefix="/transport_mode",
@@ -13,7 +15,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.TransportModeRead, status_code=201)
-def create_new_transport_mode(transport_mode: schemas.TransportModeCreate, db: Session = Depends(get_db)):
+async def create_new_transport_mode(transport_mode: schemas.TransportModeCreate, db: AsyncSession = Depends(get_async_db)):
     """
     # Register a new mode of transport
 
@@ -23,23 +25,29 @@ def create_new_transport_mode(transport_mode: schemas.TransportModeCreate, db: S
     """
     db_transport_mode = models.TransportMode(**transport_mode.model_dump())
     db.add(db_transport_mode)
-    db.commit()
-    db.refresh(db_transport_mode)
+    await etags.bump(db, "transport_mode")
+    await db.commit()
+    await db.refresh(db_transport_mode)
     return db_transport_mode
 
 @router.get("/", response_model=List[schemas.TransportModeRead])
-def get_all_transport_mode(db: Session = Depends(get_db)):
+async def get_all_transport_mode(request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
     """
     # Retrieve all available transport modes 
 
     This could be used for:
     1. Fetching all transport modes for filters.
     2. Provide options for the 'Transport Type' dropdown when creating new routes.
+
+    Sends an ETag, repeat the request with `If-None-Match` to get a 304 if nothing has changed.
     """
-    return db.query(models.TransportMode).all()
+    cached = etags.not_modified(request, response, etags.make_etag(await etags.data_version(db, "transport_mode")))
+    if cached:
+        return cached
+    return (await db.scalars(select(models.TransportMode))).all()
 
 @router.get("/{transport_mode_id}", response_model=schemas.TransportModeRead)
-def get_transport_mode_by_id(transport_mode_id: int, db: Session = Depends(get_db)):
+async def get_transport_mode_by_id(transport_mode_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
     """
     # Get details for a specific transport mode by ID 
 
@@ -47,7 +55,10 @@ def get_transport_mode_by_id(transport_mode_id: int, db: Session = Depends(get_d
 
     Returns a **404 error** if the ID does not correspond to an existing transport mode.
     """
-    transport_mode = db.query(models.TransportMode).filter(models.TransportMode.id == transport_mode_id).first()
+    cached = etags.not_modified(request, response, etags.make_etag(await etags.data_version(db, "transport_mode")))
+    if cached:
+        return cached
+    transport_mode = await db.get(models.TransportMode, transport_mode_id)
     if not transport_mode:
         raise HTTPException(status_code=404, detail="Transport mode not found")
     return transport_mode
\ No newline at end of file
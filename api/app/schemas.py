@@ -1,8 +1,14 @@
 from pydantic import BaseModel, ConfigDict, Field, field_validator, EmailStr
 from decimal import Decimal
+from datetime import datetime
 from typing import Optional, List
 
 
+# An item from a bulk request that wasn't saved, index is its position in the request
+class BulkError(BaseModel):
+    index: int
+    detail: str
+
 # CITY SCHEMAS
 class CityBase(BaseModel):
     name: str 
@@ -36,6 +42,15 @@ class StationBase(BaseModel):
 class StationCreate(StationBase):
     pass
 
+class StationUpsertRead(StationBase):
+    id: int
+    created: bool # False if the station already existed
+
+# POST /stations/bulk_upsert gives one entry per station sent, None where that one has an error
+class StationBulkResult(BaseModel):
+    stations: List[Optional[StationUpsertRead]]
+    errors: List[BulkError]
+
 class StationRead(StationBase):
     id: int 
     name: str 
@@ -82,6 +97,10 @@ class RouteRead(RouteBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class RouteBulkResult(BaseModel):
+    created: List[int] # ids of the new routes, in request order
+    errors: List[BulkError]
+
 # JOURNEY SCHEMAS - This is the result of our Dijkstra. We find the collection of cheapest routes
 class JourneyRequest(BaseModel):
     origin_station_id: int
@@ -94,6 +113,40 @@ class JourneyRead(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+# A Pareto optimal journey, total_price is the sum of the route fares without any penalties
+class JourneyOptionRead(JourneyRead):
+    changes: int
+
+# Many to many fare matrix between several origins and destinations
+class JourneyMatrixRequest(BaseModel):
+    origin_ids: List[int] = Field(..., min_length=1, max_length=200)
+    destination_ids: List[int] = Field(..., min_length=1, max_length=200)
+
+class JourneyMatrixRead(BaseModel):
+    origin_ids: List[int]
+    destination_ids: List[int]
+    # prices[i][j] / route_ids[i][j] are for origin_ids[i] -> destination_ids[j], None if there is no journey
+    prices: List[List[Optional[Decimal]]]
+    route_ids: List[List[Optional[List[int]]]]
+
+
+# One entry of a one to all search, the cheapest journey to (or from) a city
+class ReachableCityRead(BaseModel):
+    city_id: int
+    total_price: Decimal
+    route_ids: List[int]
+
+
+# ADMIN SCHEMAS - state of the in memory route graph
+class GraphStatusRead(BaseModel):
+    is_loaded: bool
+    version: int
+    last_updated: Optional[datetime]
+    build_seconds: Optional[float] # how long the last full load took
+    routes: int
+    rebuilding: bool
+    last_error: Optional[str]
+
 
 # AUTHENTICATION SCHEMA
 class AuthSchema(BaseModel):
@@ -0,0 +1,36 @@
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Helpers for the bulk endpoints. Ids and keys are sent to the database in chunks so a
+# big request stays under its limit on bound parameters (32,766 for sqlite and postgres).
+
+CHUNK_SIZE = 5000
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def existing_ids(db, id_column, ids):
+    """
+    Returns which of the ids are in the table, with one IN query per chunk
+
+    :param db: Async database session
+    :param id_column: Primary key column of the table to check
+    :param ids: Ids to look for
+    """
+    existing = set()
+    for chunk in chunks(ids):
+        existing.update(await db.scalars(select(id_column).where(id_column.in_(chunk))))
+    return existing
+
+
+def upsert_insert(db, model):
+    """
+    Returns an insert() for the session's database that supports on_conflict_do_nothing
+    """
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
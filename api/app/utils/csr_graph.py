@@ -0,0 +1,212 @@
+import heapq
+import threading
+from array import array
+
+# Compressed sparse row (CSR) copy of the adjacency graph held by GraphManager.
+# Rather than one dict per route, every edge is stored as a position in a set of
+# parallel flat arrays. The edges leaving a city are the slice
+# offsets[city]:offsets[city + 1] of those arrays. Cities and stations are remapped
+# to dense 0..n-1 indexes so the search can use arrays instead of dicts.
+
+LEG_PENALTY_PENCE = 200       # general +£2 per route taken
+TRANSFER_PENALTY_PENCE = 300  # +£3 when changing station within a city
+INF = float('inf')
+
+
+def to_pence(price):
+    """
+    Converts a price in pounds (float or Decimal) to a whole number of pence
+    """
+    return int(round(float(price) * 100))
+
+
+class CSRGraph:
+    def __init__(self, graph):
+        """
+        Builds the CSR arrays from the dict adjacency list in GraphManager.graph
+
+        :param self:
+        :param graph: Dict of origin city id -> list of edge dicts
+        """
+        # collect every city and station id so they can be given dense indexes.
+        # sorting keeps the heap tie-breaking identical to the dict based search
+        city_set = set(graph.keys())
+        station_set = set()
+        for edges in graph.values():
+            for edge in edges:
+                city_set.add(edge["destination_city"])
+                station_set.add(edge["origin_station_id"])
+                station_set.add(edge["destination_station_id"])
+
+        self.city_ids = array('q', sorted(city_set))
+        self.station_ids = array('q', sorted(station_set))
+        self.city_index = {city_id: i for i, city_id in enumerate(self.city_ids)}
+        self.station_index = {station_id: i for i, station_id in enumerate(self.station_ids)}
+
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        self.origin_stations = array('l')
+        self.destination_stations = array('l')
+        self.route_ids = array('q')
+        self.prices = array('q')
+
+        for city_id in self.city_ids:
+            # keep the original edge order so equal cost ties resolve the same way
+            for edge in graph.get(city_id, []):
+                self.targets.append(self.city_index[edge["destination_city"]])
+                self.origin_stations.append(self.station_index[edge["origin_station_id"]])
+                self.destination_stations.append(self.station_index[edge["destination_station_id"]])
+                self.route_ids.append(edge["route_id"])
+                self.prices.append(to_pence(edge["price"]))
+            self.offsets.append(len(self.targets))
+
+        # price plus the per leg penalty, so the search adds one number per edge
+        self.leg_costs = array('q', (price + LEG_PENALTY_PENCE for price in self.prices))
+
+        self._buffers = threading.local()
+
+    @classmethod
+    def from_columns(cls, city_ids, offsets, targets, origin_stations, destination_stations, route_ids, leg_costs):
+        """
+        Wraps CSR columns that already exist, e.g. ones in a shared memory graph, without
+        copying them. Stations are compared by id rather than dense index, which gives the
+        search the same answer.
+
+        :param city_ids: City id of each dense city index, sorted
+        :param offsets: Dense city index -> first edge, with one extra at the end
+        :param targets: Destination city index of each edge
+        """
+        csr = cls.__new__(cls)
+        csr.city_ids = city_ids
+        csr.station_ids = None
+        csr.city_index = {city_id: i for i, city_id in enumerate(city_ids)}
+        csr.station_index = None
+        csr.offsets = offsets
+        csr.targets = targets
+        csr.origin_stations = origin_stations
+        csr.destination_stations = destination_stations
+        csr.route_ids = route_ids
+        csr.prices = None
+        csr.leg_costs = leg_costs
+        csr._buffers = threading.local()
+        return csr
+
+    @property
+    def num_cities(self):
+        return len(self.city_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def nbytes(self):
+        """
+        Approximate memory used by the edge and index arrays in bytes
+        """
+        columns = (self.city_ids, self.station_ids, self.offsets, self.targets,
+                   self.origin_stations, self.destination_stations, self.route_ids, self.prices,
+                   self.leg_costs)
+        return sum(col.itemsize * len(col) for col in columns if col is not None)
+
+    def search_buffers(self):
+        """
+        Returns the per thread distance, visited and predecessor buffers.
+
+        They are allocated once per thread and reused by every search, each search
+        only resets the entries it touched. Being thread local means concurrent
+        requests in FastAPI's threadpool never share a buffer.
+        """
+        buffers = getattr(self._buffers, "value", None)
+        if buffers is None:
+            n = self.num_cities
+            buffers = (
+                [INF] * n,          # cheapest known cost to each city
+                bytearray(n),       # 1 once a city has been settled
+                array('l', [-1]) * n,  # edge index used to reach each city
+                array('l', [-1]) * n,  # city the predecessor edge leaves from
+            )
+            self._buffers.value = buffers
+        return buffers
+
+
+def find_cheapest_path_csr(csr, start_id, finish_id):
+    """
+    Same search as journey_finder.find_cheapest_path but run over a CSRGraph.
+    Costs are kept in whole pence so no float rounding builds up.
+
+    :param csr: CSRGraph built from the GraphManager graph
+    :param start_id: Origin city id
+    :param finish_id: Destination city id
+    """
+    start = csr.city_index.get(start_id)
+    finish = csr.city_index.get(finish_id)
+    if start is None or finish is None:
+        return None
+
+    dist, visited, pred_edge, pred_city = csr.search_buffers()
+    offsets = csr.offsets
+    targets = csr.targets
+    origin_stations = csr.origin_stations
+    destination_stations = csr.destination_stations
+    leg_costs = csr.leg_costs
+
+    touched = [start]
+    dist[start] = 0
+    # station index -1 means we have not arrived at any station yet
+    pq = [(0, start, -1)]
+    found = False
+    expanded = 0
+
+    try:
+        while pq:
+            current_cost, current_city, destination_station = heapq.heappop(pq)
+
+            if current_city == finish:
+                found = True
+                break
+
+            if visited[current_city]:
+                continue
+            visited[current_city] = 1
+            expanded += 1
+
+            lo = offsets[current_city]
+            hi = offsets[current_city + 1]
+            # slicing the columns is done in C, so the loop body only does the cost maths
+            for e, next_city, leg_cost, origin_station, next_station in zip(
+                range(lo, hi), targets[lo:hi], leg_costs[lo:hi], origin_stations[lo:hi], destination_stations[lo:hi]
+            ):
+                new_cost = current_cost + leg_cost
+                if origin_station != destination_station:
+                    new_cost += TRANSFER_PENALTY_PENCE
+
+                if new_cost < dist[next_city]:
+                    dist[next_city] = new_cost
+                    pred_edge[next_city] = e
+                    pred_city[next_city] = current_city
+                    touched.append(next_city)
+                    heapq.heappush(pq, (new_cost, next_city, next_station))
+
+        if not found:
+            return None
+
+        # walk the predecessor edges back to the start to rebuild the route ids
+        route_ids = []
+        city = finish
+        while city != start:
+            route_ids.append(csr.route_ids[pred_edge[city]])
+            city = pred_city[city]
+        route_ids.reverse()
+
+        return {
+            "total_price": (current_cost - LEG_PENALTY_PENCE - TRANSFER_PENALTY_PENCE) / 100,
+            "route_ids": route_ids,
+            "expanded": expanded
+        }
+    finally:
+        # reset only what this search touched so the buffers can be reused
+        for city in touched:
+            dist[city] = INF
+            visited[city] = 0
+            pred_edge[city] = -1
+            pred_city[city] = -1
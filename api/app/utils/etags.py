@@ -0,0 +1,84 @@
+from fastapi import Response
+from sqlalchemy import select, update
+
+from .. import models
+from ..config import settings
+
+# Conditional GET support. An ETag is built from the versions of the data a response
+# depends on.
+#
+# Cities and transport modes have a version row each in the data_versions table, bumped
+# in the same transaction as every write to them, so every worker (and a restarted one)
+# hands out and accepts the same ETags. Checking one costs a primary key read instead of
+# the full query.
+#
+# Journeys come from the worker's graph and route catalogue, so their ETag is a hash of
+# those (GraphState.digest). It depends only on the routes being served, so it is the
+# same in every worker that has the same routes and after a restart.
+
+# kinds of data with a row in data_versions. route is bumped by every route write and
+# is what tells graph_snapshot.database_stamp the routes table has changed
+KINDS = ("city", "transport_mode", "route")
+
+
+def bump_query(*kinds):
+    """
+    Returns the UPDATE marking the given kinds of data as changed, or every kind if none
+    are given. Run it in the same transaction as the write so the two can't be split.
+    """
+    return (
+        update(models.DataVersion)
+        .where(models.DataVersion.kind.in_(kinds or KINDS))
+        .values(version=models.DataVersion.version + 1)
+    )
+
+
+async def bump(db, *kinds):
+    """
+    Marks the given kinds of data as changed in the async session's transaction, the caller commits
+    """
+    await db.execute(bump_query(*kinds))
+
+
+async def data_version(db, kind):
+    """
+    Returns the current version of one kind of data
+    """
+    version = await db.scalar(select(models.DataVersion.version).where(models.DataVersion.kind == kind))
+    return version or 0
+
+
+def make_etag(*parts):
+    """
+    Builds a strong ETag from the given version numbers or hashes
+    """
+    return '"' + "-".join(map(str, parts)) + '"'
+
+
+def cache_headers(etag):
+    return {
+        "ETag": etag,
+        # responses need a login so only the client's own cache may keep them
+        "Cache-Control": f"private, max-age={settings.HTTP_CACHE_MAX_AGE}, must-revalidate",
+    }
+
+
+def not_modified(request, response, etag):
+    """
+    Sets the caching headers on response and, if the client already has this version,
+    returns the 304 response to send instead. Returns None if the full response is needed.
+
+    :param request: The incoming Request
+    :param response: The Response the endpoint's headers are set on
+    :param etag: ETag of the data the endpoint would return
+    """
+    headers = cache_headers(etag)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # the header can list several tags, and W/ tags are compared weakly as RFC 9110 says
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
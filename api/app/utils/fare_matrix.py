@@ -0,0 +1,149 @@
+import threading
+
+import numpy as np
+
+# Dense all pairs engine. The graph is turned into a matrix of the cheapest direct
+# cost between every pair of stations, and Floyd-Warshall is run over it with each
+# of its n passes done as one vectorised NumPy min-plus update over the whole matrix.
+# That is far faster than running the Python Dijkstra from every city.
+#
+# Stations are the rows and columns rather than cities, because the £3 transfer fee
+# depends on which station you arrive at and which you leave from. Each route is a
+# station -> station entry costing price + £2, and every pair of stations in the same
+# city is linked with a £3 transfer. A city to city fare is then the cheapest entry
+# between any of their stations, which prices journeys exactly like the bidirectional
+# search does.
+
+NO_ROUTE = -1 # route id slot for a transfer between two stations in one city
+
+
+class FareMatrix:
+    def __init__(self, graph_manager):
+        """
+        Builds the station cost matrix from the GraphManager graph and solves it
+
+        :param self:
+        :param graph_manager: The GraphManager to build the matrix from
+        """
+        # the matrix is built from one state, so it matches that state's version exactly
+        state = graph_manager.state
+        self.version = state.version
+        edges = [edge for city_edges in state.graph.values() for edge in city_edges]
+
+        # station -> city, for every station any route uses
+        station_city = {}
+        for edge in edges:
+            station_city[edge["origin_station_id"]] = edge["origin_city"]
+            station_city[edge["destination_station_id"]] = edge["destination_city"]
+
+        # order the stations by city so each city's stations are one contiguous block
+        self.station_ids = np.array(sorted(station_city, key=lambda s: (station_city[s], s)), dtype=np.int64)
+        station_cities = np.array([station_city[s] for s in self.station_ids.tolist()], dtype=np.int64)
+        self.station_index = {station_id: i for i, station_id in enumerate(self.station_ids.tolist())}
+        self.city_ids, self.city_starts = np.unique(station_cities, return_index=True)
+        self.city_index = {city_id: i for i, city_id in enumerate(self.city_ids.tolist())}
+        n = len(self.station_ids)
+
+        # cheapest direct cost and the route giving it
+        costs = np.full((n, n), np.inf)
+        routes = np.full((n, n), NO_ROUTE, dtype=np.int64)
+        if edges:
+            rows = np.array([self.station_index[e["origin_station_id"]] for e in edges])
+            cols = np.array([self.station_index[e["destination_station_id"]] for e in edges])
+            leg_costs = np.array([e["price"] + 2 for e in edges]) # +2 per leg, as in the searches
+            route_ids = np.array([e["route_id"] for e in edges], dtype=np.int64)
+            # sort by cost, most expensive first, so the cheapest route between two stations is written last
+            order = np.argsort(-leg_costs, kind="stable")
+            costs[rows[order], cols[order]] = leg_costs[order]
+            routes[rows[order], cols[order]] = route_ids[order]
+
+        # £3 to move between two stations in the same city
+        same_city = station_cities[:, None] == station_cities[None, :]
+        transfers = same_city & (costs > 3)
+        costs[transfers] = 3
+        routes[transfers] = NO_ROUTE
+        np.fill_diagonal(costs, 0)
+
+        # next_hop[i, j] is the station to go to next from i on the way to j
+        next_hop = np.where(np.isfinite(costs), np.arange(n)[None, :], -1)
+
+        # row and column k never change during pass k (costs[k, k] is 0), so both
+        # matrices can be updated in place
+        through_k = np.empty_like(costs)
+        better = np.empty(costs.shape, dtype=bool)
+        for k in range(n):
+            np.add(costs[:, k, None], costs[None, k, :], out=through_k)
+            np.less(through_k, costs, out=better)
+            np.copyto(costs, through_k, where=better)
+            np.copyto(next_hop, next_hop[:, k, None], where=better)
+
+        self.costs = costs
+        self.direct_routes = routes
+        self.next_hop = next_hop
+
+        # city x city fares: the cheapest entry in each block of station rows and columns
+        by_origin = np.minimum.reduceat(costs, self.city_starts, axis=0) if n else costs
+        self.city_costs = np.minimum.reduceat(by_origin, self.city_starts, axis=1) if n else costs
+
+    def is_fresh(self, graph_manager):
+        return self.version == graph_manager.version
+
+    def lookup(self, start_id, finish_id):
+        """
+        Returns the cheapest journey in the same shape as find_cheapest_path, or None
+        if there isn't one
+        """
+        if start_id == finish_id:
+            return {"total_price": -5, "route_ids": []} # matches find_cheapest_path
+        a = self.city_index.get(start_id)
+        b = self.city_index.get(finish_id)
+        if a is None or b is None or not np.isfinite(self.city_costs[a, b]):
+            return None
+
+        # find the station pair that gives the city fare, then follow the next hops
+        a_start, a_end = self._block(a)
+        b_start, b_end = self._block(b)
+        block = self.costs[a_start:a_end, b_start:b_end]
+        i, j = np.unravel_index(np.argmin(block), block.shape)
+        station, target = a_start + int(i), b_start + int(j)
+
+        route_ids = []
+        while station != target:
+            hop = int(self.next_hop[station, target])
+            route_id = int(self.direct_routes[station, hop])
+            if route_id != NO_ROUTE:
+                route_ids.append(route_id)
+            station = hop
+
+        # the searches charge £3 for the first station and +2 for every leg,
+        # then take £5 back off, so the net is -£2 on top of the matrix cost
+        return {
+            "total_price": float(self.city_costs[a, b]) + 3 - 5,
+            "route_ids": route_ids
+        }
+
+    def _block(self, city):
+        start = int(self.city_starts[city])
+        end = int(self.city_starts[city + 1]) if city + 1 < len(self.city_starts) else len(self.station_ids)
+        return start, end
+
+
+_build_lock = threading.Lock()
+
+
+def get_fare_matrix(graph_manager):
+    """
+    Returns the FareMatrix for the current graph, building it the first time it's
+    needed and again whenever the graph version has moved on
+    """
+    matrix = graph_manager.fare_matrix
+    if matrix is not None and matrix.is_fresh(graph_manager):
+        return matrix
+
+    with _build_lock:
+        # another request may have built it while we waited
+        matrix = graph_manager.fare_matrix
+        if matrix is None or not matrix.is_fresh(graph_manager):
+            matrix = FareMatrix(graph_manager)
+            graph_manager.fare_matrix = matrix
+    return matrix
@@ -0,0 +1,243 @@
+import json
+import os
+import struct
+from array import array
+from collections.abc import Mapping
+
+from .journey_finder import shortest_path_tree, unwind_path
+
+# With only ~200 cities the cheapest fare between every pair of cities is small
+# enough to work out ahead of time. The table holds, for every origin, the search
+# cost to each destination and the predecessor route used to reach it, so a
+# journey is a dict lookup plus a walk back along the predecessors.
+
+FORMAT_VERSION = 1
+
+# the table as flat n x n columns, for workers to share (see shared_graph.py):
+# magic, city count and size in bytes, then the city ids, the costs (inf if unreachable),
+# the predecessor route ids (-1 if none) and the predecessor city indexes
+BUFFER_MAGIC = b"RGFT"
+BUFFER_HEADER = struct.Struct("<4sIQ")
+INF = float('inf')
+
+
+class FareTable:
+    def __init__(self):
+        self.costs = {}         # origin -> {destination: search cost}
+        self.predecessors = {}  # origin -> {destination: (route_id, previous city)}
+        self.version = None     # GraphManager.version the table was built from
+        self.signature = None   # GraphManager.signature() the table was built from
+
+    def build(self, graph_manager):
+        """
+        Runs one full search from every origin city in the graph. Every search runs over the
+        same state, so the table matches that state's version exactly. If a route is written
+        while it runs the table is stale, and /journeys searches live instead of serving a
+        fare missing the new route until the table is next built.
+
+        :param self:
+        :param graph_manager: The GraphManager to build the table from
+        """
+        state = graph_manager.state
+        costs = {}
+        predecessors = {}
+        for origin in state.graph:
+            costs[origin], predecessors[origin] = shortest_path_tree(state, origin)
+
+        self.costs = costs
+        self.predecessors = predecessors
+        self.version = state.version
+        self.signature = state.signature()
+        return self
+
+    def is_fresh(self, graph_manager):
+        """
+        The table is only valid for the exact graph version it was built from
+        """
+        return self.version is not None and self.version == graph_manager.version
+
+    def lookup(self, start_id, finish_id):
+        """
+        Returns the cheapest journey in the same shape as find_cheapest_path, or None
+        if finish_id can't be reached from start_id
+        """
+        costs = self.costs.get(start_id)
+        if costs is None or finish_id not in costs:
+            return None
+
+        return {
+            "total_price": costs[finish_id] - 5, # remove the £5 fee added for the first station
+            "route_ids": unwind_path(self.predecessors[start_id], start_id, finish_id)
+        }
+
+    def save(self, path):
+        """
+        Writes the table to a JSON file so a restart can reuse it
+        """
+        data = {
+            "format": FORMAT_VERSION,
+            "signature": self.signature,
+            "costs": {
+                origin: [[dest, cost] for dest, cost in costs.items()]
+                for origin, costs in self.costs.items()
+            },
+            "predecessors": {
+                origin: [[dest, route_id, prev] for dest, (route_id, prev) in preds.items()]
+                for origin, preds in self.predecessors.items()
+            },
+        }
+        # write to a temporary file first so a crash never leaves half a table behind.
+        # named per process, as several workers can save the same table at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path, graph_manager):
+        """
+        Loads a saved table if it was built from a graph identical to the current one.
+        Returns True if the table was loaded.
+        """
+        if not os.path.exists(path):
+            return False
+
+        # the signature is checked against one state, so the table is fresh for exactly that one
+        state = graph_manager.state
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("format") != FORMAT_VERSION or data.get("signature") != state.signature():
+            return False
+
+        self.costs = {
+            int(origin): {dest: cost for dest, cost in costs}
+            for origin, costs in data["costs"].items()
+        }
+        self.predecessors = {
+            int(origin): {dest: (route_id, prev) for dest, route_id, prev in preds}
+            for origin, preds in data["predecessors"].items()
+        }
+        self.signature = data["signature"]
+        self.version = state.version
+        return True
+
+    def to_bytes(self):
+        """
+        Returns the table as flat columns, which from_buffer can use without copying
+        """
+        city_ids = sorted(set(self.costs).union(*self.costs.values()))
+        index = {city_id: i for i, city_id in enumerate(city_ids)}
+        n = len(city_ids)
+        costs = array('d', [INF]) * (n * n)
+        routes = array('q', [-1]) * (n * n)
+        previous = array('q', [-1]) * (n * n)
+        for origin, origin_costs in self.costs.items():
+            row = index[origin] * n
+            for dest, cost in origin_costs.items():
+                costs[row + index[dest]] = cost
+            for dest, (route_id, prev) in self.predecessors[origin].items():
+                routes[row + index[dest]] = route_id
+                previous[row + index[dest]] = index[prev]
+
+        data = b"".join(column.tobytes() for column in (array('q', city_ids), costs, routes, previous))
+        return BUFFER_HEADER.pack(BUFFER_MAGIC, n, BUFFER_HEADER.size + len(data)) + data
+
+    @classmethod
+    def from_buffer(cls, buffer, version):
+        """
+        Returns a table reading the columns to_bytes wrote straight out of buffer, or None
+        if buffer doesn't start with one. costs and predecessors are then read only views.
+
+        :param buffer: memoryview holding the table
+        :param version: GraphManager.version of the graph the table was built from
+        """
+        if len(buffer) < BUFFER_HEADER.size:
+            return None
+        magic, n, size = BUFFER_HEADER.unpack_from(buffer)
+        if magic != BUFFER_MAGIC or size > len(buffer):
+            return None
+
+        offset = BUFFER_HEADER.size
+        columns = []
+        for typecode, count in (('q', n), ('d', n * n), ('q', n * n), ('q', n * n)):
+            columns.append(buffer[offset:offset + 8 * count].cast(typecode))
+            offset += 8 * count
+        city_ids, costs, routes, previous = columns
+
+        def cost(i, j):
+            value = costs[i * n + j]
+            return None if value == INF else value
+
+        def predecessor(i, j):
+            route_id = routes[i * n + j]
+            return None if route_id == -1 else (route_id, city_ids[previous[i * n + j]])
+
+        # a city has a row if it was searched from, which always reaches the city itself
+        index = {city_id: i for i, city_id in enumerate(city_ids)}
+        origins = {city_id: i for city_id, i in index.items() if costs[i * n + i] == 0}
+
+        table = cls()
+        table.costs = _Rows(city_ids, index, origins, cost)
+        table.predecessors = _Rows(city_ids, index, origins, predecessor)
+        table.version = version
+        return table
+
+    @classmethod
+    def load_or_build(cls, graph_manager, path=None):
+        """
+        Reuses the table saved at path when it matches the graph, otherwise builds
+        a new one (and saves it if a path was given)
+        """
+        table = cls()
+        if path and table.load(path, graph_manager):
+            return table
+
+        table.build(graph_manager)
+        # a table that isn't fresh may have raced with a write and not match its signature, so it isn't saved
+        if path and table.is_fresh(graph_manager):
+            table.save(path)
+        return table
+
+
+class _Rows(Mapping):
+    """
+    origin -> {destination: value} over a flat n x n column, where cell(i, j) gives the
+    value for origin index i and destination index j, or None if there isn't one
+    """
+    def __init__(self, city_ids, index, origins, cell):
+        self.city_ids = city_ids
+        self.index = index
+        self.origins = origins
+        self.cell = cell
+
+    def __getitem__(self, origin):
+        return _Row(self, self.origins[origin])
+
+    def __iter__(self):
+        return iter(self.origins)
+
+    def __len__(self):
+        return len(self.origins)
+
+
+class _Row(Mapping):
+    def __init__(self, rows, i):
+        self.rows = rows
+        self.i = i
+
+    def __getitem__(self, destination):
+        j = self.rows.index.get(destination)
+        value = None if j is None else self.rows.cell(self.i, j)
+        if value is None:
+            raise KeyError(destination)
+        return value
+
+    def __iter__(self):
+        cell = self.rows.cell
+        return (city_id for j, city_id in enumerate(self.rows.city_ids) if cell(self.i, j) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
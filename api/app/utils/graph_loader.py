@@ -0,0 +1,140 @@
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from .. import models
+from ..config import settings
+from . import graph_snapshot
+from .fare_table import FareTable
+from .fare_matrix import get_fare_matrix
+from .shared_graph import SharedGraph
+from .route_catalogue import RouteCatalogue
+
+# Loads the graph with one column only select instead of full Route, Station and City
+# models. Only the values each edge and catalogue record need are fetched, and the rows are streamed
+# in batches (a server side cursor on Postgres) straight into the graph builder, so the
+# whole route table is never held in memory as ORM objects.
+
+BATCH_SIZE = 5000
+
+
+def route_rows(db, batch_size=BATCH_SIZE):
+    """
+    Streams (route id, origin city, destination city, origin station, destination station,
+    transport mode name, price, notes, transport mode id) for every route. The first seven
+    make the graph edge, the rest are for the route catalogue.
+
+    :param db: Database session
+    :param batch_size: Rows fetched from the database at a time
+    """
+    origin = aliased(models.Station)
+    destination = aliased(models.Station)
+    query = (
+        select(
+            models.Route.id,
+            origin.city_id,
+            destination.city_id,
+            models.Route.origin_station_id,
+            models.Route.destination_station_id,
+            models.TransportMode.name,
+            models.Route.price,
+            models.Route.notes,
+            models.Route.transport_mode_id,
+        )
+        .join(origin, models.Route.origin_station_id == origin.id)
+        .join(destination, models.Route.destination_station_id == destination.id)
+        .join(models.TransportMode, models.Route.transport_mode_id == models.TransportMode.id)
+        .order_by(models.Route.id)
+        .execution_options(yield_per=batch_size)
+    )
+    return db.execute(query)
+
+
+def city_coordinates(db):
+    """
+    Returns {city id: (latitude, longitude)} for every city
+    """
+    return {
+        city_id: (float(latitude), float(longitude))
+        for city_id, latitude, longitude in db.execute(
+            select(models.City.id, models.City.latitude, models.City.longitude)
+        )
+    }
+
+
+def load_graph(graph_manager, db, batch_size=BATCH_SIZE):
+    """
+    Builds the GraphManager graph, and the route catalogue with it, straight from the database
+
+    :param graph_manager: The GraphManager to build
+    :param db: Database session
+    :param batch_size: Rows fetched from the database at a time
+    """
+    coordinates = city_coordinates(db)
+    catalogue = RouteCatalogue.load_tables(db)
+
+    def rows():
+        # the catalogue's route records come from the same rows as the graph
+        for row in route_rows(db, batch_size):
+            catalogue.add_row(row)
+            yield row
+
+    graph_manager.replace_graph(
+        lambda: graph_manager.build_graph_from_rows(rows(), coordinates, catalogue)
+    )
+
+
+def prepare_graph(graph_manager, db, reload=False):
+    """
+    Gets the graph and everything built from it ready. Used on startup and by the admin
+    reload. Returns where the graph came from.
+
+    :param graph_manager: The GraphManager to build
+    :param db: Database session
+    :param reload: True to always load from the database, ignoring the snapshot and shared copy
+    """
+    started = time.perf_counter()
+
+    # the snapshot is only used if it was taken since the last change to the database
+    stamp = graph_snapshot.database_stamp(db)
+    path = settings.GRAPH_SNAPSHOT_PATH
+    # with several workers only the first one loads the graph, the rest attach to its copy
+    shared = graph_manager.shared
+    if shared is None and settings.GRAPH_SHARED_MEMORY:
+        shared = SharedGraph(settings.GRAPH_SHARED_MEMORY)
+        # set straight away, so the worker still detaches on shutdown if the load fails
+        graph_manager.shared = shared
+
+    if not reload and shared and shared.attach(graph_manager, stamp):
+        source = "shared memory"
+    elif not reload and path and graph_snapshot.load_snapshot(graph_manager, path, stamp):
+        source = "snapshot"
+    else:
+        # build the graph, streaming just the columns it needs
+        load_graph(graph_manager, db)
+        if path:
+            graph_snapshot.save_snapshot(graph_manager, path, stamp)
+        source = "database"
+    print(f"Graph built from {source} in {time.perf_counter() - started:.2f}s.")
+
+    # a shared graph comes with its CSR columns and fare table
+    if source != "shared memory":
+        if settings.GRAPH_LAYOUT == "csr" and not shared:
+            graph_manager.build_csr()
+
+        # precompute the cheapest fare between every pair of cities
+        graph_manager.fare_table = FareTable.load_or_build(graph_manager, settings.FARE_TABLE_PATH)
+        if shared:
+            # every worker, this one included, then searches the published copy
+            shared.publish(graph_manager, stamp, graph_manager.fare_table)
+
+    if graph_manager.fare_table is not None:
+        print(f"Fare table ready for {len(graph_manager.fare_table.costs)} origin cities.")
+    else:
+        print("No fare table was published with the shared graph, journeys are searched live.")
+    if settings.JOURNEY_ALGORITHM == "matrix":
+        get_fare_matrix(graph_manager)
+
+    graph_manager.build_seconds = time.perf_counter() - started
+    return source
@@ -2,17 +2,258 @@
 # to the adjacency list of all nodes. This will ensure that endpoints
 # don't have to fetch all possible routes between nodes.
 
+import hashlib
+import math
+import threading
+from datetime import datetime, timezone
+
+from .csr_graph import CSRGraph
+
+
+class GraphState:
+    """
+    Everything the searches read that is built from one graph: the adjacency lists, their
+    per mode and reverse indexes, the A* calibration, the route catalogue and the CSR copy.
+    GraphManager swaps a whole new state in with one assignment, so a search that takes
+    GraphManager.state once sees one consistent graph while a reload or write replaces it.
+    """
+    def __init__(self):
+        self.graph = {}
+        self.reverse_graph = {} # destination city -> edges arriving there, for backward searches
+        # the same edges split by transport mode, so filtered searches don't check each edge's mode
+        self.mode_graphs = {}         # mode name -> {origin city: edges}
+        self.mode_reverse_graphs = {} # mode name -> {destination city: edges}
+        self._mode_graph_cache = {}   # (frozenset of modes, reverse) -> merged adjacency
+        self.route_origins = {} # route id -> origin city, to find an edge without scanning
+        self.coordinates = {} # city id -> (latitude, longitude) for the A* heuristic
+        self.min_price_per_km = 0.0
+        self.catalogue = None # RouteCatalogue of the records journeys are built from
+        self.csr = None
+        self.version = 0
+        self._digest = None
+
+    @classmethod
+    def from_edges(cls, edges, coordinates, catalogue=None):
+        """
+        Builds a state holding the given edges
+
+        :param edges: Iterable of edge dicts in the shape GraphManager.edge_from_route makes
+        :param coordinates: Dict of city id -> (latitude, longitude)
+        :param catalogue: RouteCatalogue of the same routes
+        """
+        state = cls()
+
+        for edge_data in edges:
+            origin_city = edge_data["origin_city"]
+
+            if origin_city not in state.graph:
+                state.graph[origin_city] = []
+            
+            state.graph[origin_city].append(edge_data)
+            # the reverse index shares the same edge dicts, so it costs one list slot per route
+            state.reverse_graph.setdefault(edge_data["destination_city"], []).append(edge_data)
+            mode = edge_data["transport_mode"]
+            state.mode_graphs.setdefault(mode, {}).setdefault(origin_city, []).append(edge_data)
+            state.mode_reverse_graphs.setdefault(mode, {}).setdefault(edge_data["destination_city"], []).append(edge_data)
+            state.route_origins[edge_data["route_id"]] = origin_city
+
+        state.coordinates = coordinates
+        state.min_price_per_km = GraphManager.calibrate_price_per_km(state.graph, coordinates)
+        state.catalogue = catalogue
+        return state
+
+    @property
+    def state(self):
+        # lets a state be passed to the searches in place of the GraphManager it came from
+        return self
+
+    def copy(self):
+        """
+        Returns a state sharing this one's edge lists but with its own dicts, for a write
+        to change before it is swapped in. Edge lists are never changed in place, a new
+        list is built and assigned, so the two states never see each other's changes.
+
+        :param self:
+        """
+        state = GraphState()
+        state.graph = dict(self.graph)
+        state.reverse_graph = dict(self.reverse_graph)
+        state.mode_graphs = {mode: dict(graph) for mode, graph in self.mode_graphs.items()}
+        state.mode_reverse_graphs = {mode: dict(graph) for mode, graph in self.mode_reverse_graphs.items()}
+        state.route_origins = dict(self.route_origins)
+        state.coordinates = dict(self.coordinates)
+        state.min_price_per_km = self.min_price_per_km
+        state.catalogue = self.catalogue.copy() if self.catalogue is not None else None
+        state.csr = self.csr
+        state.version = self.version
+        return state
+
+    def add_edge(self, route):
+        """
+        Adds a route to this state in O(degree) time
+
+        :param self:
+        :param route: Route Model with its stations, cities and transport mode loaded
+        """
+        edge = GraphManager.edge_from_route(route)
+        if edge is None:
+            return
+        origin_city, edge_data = edge
+        # a rebuild may already have picked the route up from the database
+        self.remove_edge(edge_data["route_id"])
+        if self.catalogue is not None:
+            self.catalogue.put_route(route)
+
+        dest_city = edge_data["destination_city"]
+        mode = edge_data["transport_mode"]
+        self.graph[origin_city] = self.graph.get(origin_city, []) + [edge_data]
+        self.reverse_graph[dest_city] = self.reverse_graph.get(dest_city, []) + [edge_data]
+        mode_graph = self.mode_graphs.setdefault(mode, {})
+        mode_graph[origin_city] = mode_graph.get(origin_city, []) + [edge_data]
+        mode_reverse_graph = self.mode_reverse_graphs.setdefault(mode, {})
+        mode_reverse_graph[dest_city] = mode_reverse_graph.get(dest_city, []) + [edge_data]
+        self.route_origins[edge_data["route_id"]] = origin_city
+
+        # a new cheaper rate must lower the A* rate or the heuristic could overestimate.
+        # removing or raising a price never needs it raised, it just stays a bit loose
+        self.coordinates.update(GraphManager.coordinates_from_route(route))
+        self.min_price_per_km = min(
+            self.min_price_per_km,
+            GraphManager.calibrate_price_per_km({origin_city: [edge_data]}, self.coordinates) or float('inf')
+        )
+
+    def remove_edge(self, route_id):
+        """
+        Removes a route from this state in O(degree) time
+
+        :param self:
+        :param route_id: ID of the route
+        """
+        if self.catalogue is not None:
+            self.catalogue.remove_route(route_id)
+        origin_city = self.route_origins.pop(route_id, None)
+        if origin_city is None:
+            return
+
+        removed = None
+        for edge in self.graph.get(origin_city, []):
+            if edge["route_id"] == route_id:
+                removed = edge
+                break
+        if removed is None:
+            return
+
+        dest_city = removed["destination_city"]
+        mode = removed["transport_mode"]
+        self._drop_edge(self.graph, origin_city, route_id)
+        self._drop_edge(self.reverse_graph, dest_city, route_id)
+        self._drop_edge(self.mode_graphs.get(mode, {}), origin_city, route_id)
+        self._drop_edge(self.mode_reverse_graphs.get(mode, {}), dest_city, route_id)
+
+    @staticmethod
+    def _drop_edge(adjacency, city, route_id):
+        edges = [edge for edge in adjacency.get(city, []) if edge["route_id"] != route_id]
+        if edges:
+            adjacency[city] = edges
+        else:
+            adjacency.pop(city, None)
+
+    def signature(self):
+        """
+        Returns a hash of every edge in the graph. Unlike the version this is the same
+        across restarts, so it can tell if something saved to disk matches the graph.
+
+        :param self:
+        """
+        digest = hashlib.sha256()
+        graph = self.graph
+        for origin_city in sorted(graph):
+            for edge in sorted(graph[origin_city], key=lambda e: e["route_id"]):
+                digest.update(
+                    f"{edge['route_id']},{origin_city},{edge['destination_city']},"
+                    f"{edge['origin_station_id']},{edge['destination_station_id']},{edge['price']:.2f};".encode()
+                )
+        return digest.hexdigest()
+
+    def digest(self):
+        """
+        Returns a hash of the graph and route catalogue. Unlike the version it is the same
+        for the same routes in every worker and after a restart, so it can be handed out
+        as an ETag. Worked out the first time it's asked for, as a state never changes
+        once it has been swapped in.
+
+        :param self:
+        """
+        if self._digest is None:
+            # imported here as the snapshot module needs the database models
+            from .graph_snapshot import HEADER, snapshot_bytes
+            # the header holds the database stamp, which isn't part of the graph
+            self._digest = hashlib.sha256(snapshot_bytes(self, bytes(32))[HEADER.size:]).hexdigest()
+        return self._digest
+
+    def graph_for(self, modes=None, reverse=False):
+        """
+        Returns the adjacency list holding only edges of the given transport modes.
+        Single modes are kept up to date by the build and the edge operations, a mix of
+        modes is merged once and cached for as long as this state is in use.
+
+        :param self:
+        :param modes: Iterable of transport mode names, None for every mode
+        :param reverse: True for the destination city keyed index instead
+        """
+        full = self.reverse_graph if reverse else self.graph
+        per_mode = self.mode_reverse_graphs if reverse else self.mode_graphs
+        if not modes:
+            return full
+
+        modes = frozenset(modes)
+        if modes >= per_mode.keys():
+            return full
+        if len(modes) == 1:
+            return per_mode.get(next(iter(modes)), {})
+
+        key = (modes, reverse)
+        merged = self._mode_graph_cache.get(key)
+        if merged is None:
+            merged = {}
+            for mode in modes:
+                for city, edges in per_mode.get(mode, {}).items():
+                    merged[city] = merged.get(city, []) + edges
+            self._mode_graph_cache[key] = merged
+        return merged
+
+
 class GraphManager:
     _instance = None 
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(GraphManager, cls).__new__(cls)
-            cls._instance.graph = {}
+            cls._instance.state = GraphState()
+            cls._instance.fare_table = None
+            cls._instance.fare_matrix = None
+            cls._instance.shared = None # SharedGraph when the graph is shared between workers
+            # reentrant so build_csr can take it while a shared write already holds it
+            cls._instance._write_lock = threading.RLock()
             cls._instance.last_updated = None
             cls._instance.is_loaded = False
+            cls._instance.build_seconds = None # how long the last full load took
         
         return cls._instance
+
+    # read only views of the current state, for code that only needs one part of it.
+    # a search that reads several parts takes GraphManager.state once instead
+    graph = property(lambda self: self.state.graph)
+    reverse_graph = property(lambda self: self.state.reverse_graph)
+    mode_graphs = property(lambda self: self.state.mode_graphs)
+    mode_reverse_graphs = property(lambda self: self.state.mode_reverse_graphs)
+    route_origins = property(lambda self: self.state.route_origins)
+    coordinates = property(lambda self: self.state.coordinates)
+    min_price_per_km = property(lambda self: self.state.min_price_per_km)
+    catalogue = property(lambda self: self.state.catalogue)
+    csr = property(lambda self: self.state.csr)
+    # the version lets anything derived from the graph (e.g. the fare table) tell if it is stale
+    version = property(lambda self: self.state.version)
     
     def build_graph(self, routes_from_db):
         """
@@ -21,33 +262,271 @@ class GraphManager:
         :param self: 
         :param routes_from_db: Array of Route Models from them
         """
-        new_graph = {}
+        edges = []
+        coordinates = {}
 
         for route in routes_from_db:
-            # we need to work out the origin city, destination city, price, origin station, destinatino station
-            try:
-                origin_city = route.origin_station.city.id
-                dest_city = route.destination_station.city.id
-
-                # railcard
-                if route.transport_mode.name == "train":
-                    price = float(route.price) 
-                else:
-                    price = route.price
-                
-                edge_data = {
-                    "route_id": route.id,
-                    "destination_city": dest_city,
-                    "origin_station_id": route.origin_station.id,
-                    "destination_station_id": route.destination_station.id,
-                    "price": float(price)
-                }
-
-                if origin_city not in new_graph:
-                    new_graph[origin_city] = []
-                
-                new_graph[origin_city].append(edge_data)
-            except AttributeError as e:
+            edge = self.edge_from_route(route)
+            if edge is None:
                 continue
+            edges.append(edge[1])
+            coordinates.update(self.coordinates_from_route(route))
+
+        self.build_graph_from_edges(edges, coordinates)
+
+    def build_graph_from_rows(self, rows, coordinates, catalogue=None):
+        """
+        Builds the adjacency graph from plain database rows rather than Route models
+
+        :param self:
+        :param rows: Iterable of rows from graph_loader.route_rows
+        :param coordinates: Dict of city id -> (latitude, longitude)
+        :param catalogue: RouteCatalogue to swap in along with the graph
+        """
+        self.build_graph_from_edges((self.edge_from_row(row) for row in rows), coordinates, catalogue)
+
+    def build_graph_from_edges(self, edges, coordinates, catalogue=None):
+        """
+        Builds the adjacency graph from edge dicts that are already worked out, e.g. ones
+        read back from a graph snapshot instead of from Route models. If the current graph
+        has a CSR copy the new one gets one too, and everything is swapped in together.
+
+        :param self:
+        :param edges: Iterable of edge dicts in the shape edge_from_route makes
+        :param coordinates: Dict of city id -> (latitude, longitude)
+        :param catalogue: RouteCatalogue of the same routes, None to keep the current one
+        """
+        state = GraphState.from_edges(
+            edges, coordinates, catalogue if catalogue is not None else self.state.catalogue
+        )
+        if self.state.csr is not None:
+            state.csr = CSRGraph(state.graph)
+        self.swap(state)
+
+    def swap(self, state):
+        """
+        Makes state the graph every search uses from now on, with a new version number so
+        anything derived from the old graph (cached journeys, the fare table) is stale
+
+        :param self:
+        :param state: GraphState to swap in
+        """
+        state.version = self.state.version + 1
+        self.state = state
+        self.last_updated = datetime.now(timezone.utc)
+        self.is_loaded = True
+
+    def replace_graph(self, load):
+        """
+        Runs load(), which builds a whole new graph, while holding the write lock. Searches
+        carry on against the old graph until it is swapped out at the end of the build,
+        and a route written during the rebuild waits and is then applied to the new graph
+        instead of being lost with the old one.
+
+        :param self:
+        :param load: Function that builds the graph, e.g. with build_graph_from_rows
+        """
+        with self._write_lock:
+            load()
+
+    @staticmethod
+    def edge_from_route(route):
+        """
+        Turns a Route model into (origin city id, edge dict), or None if the
+        route's stations or cities can't be loaded
+
+        :param route: Route Model with its stations, cities and transport mode loaded
+        """
+        # we need to work out the origin city, destination city, price, origin station, destinatino station
+        try:
+            origin_city = route.origin_station.city.id
+            dest_city = route.destination_station.city.id
+
+            # railcard
+            if route.transport_mode.name == "train":
+                price = float(route.price) 
+            else:
+                price = route.price
+            
+            edge_data = {
+                "route_id": route.id,
+                "origin_city": origin_city,
+                "destination_city": dest_city,
+                "origin_station_id": route.origin_station.id,
+                "destination_station_id": route.destination_station.id,
+                "transport_mode": route.transport_mode.name,
+                "price": float(price)
+            }
+        except AttributeError as e:
+            return None
+
+        return origin_city, edge_data
+
+    @staticmethod
+    def edge_from_row(row):
+        """
+        Turns a row from graph_loader.route_rows into an edge dict
+        """
+        route_id, origin_city, dest_city, origin_station, dest_station, mode, price, *_ = row
+        return {
+            "route_id": route_id,
+            "origin_city": origin_city,
+            "destination_city": dest_city,
+            "origin_station_id": origin_station,
+            "destination_station_id": dest_station,
+            "transport_mode": mode,
+            "price": float(price)
+        }
+
+    @staticmethod
+    def coordinates_from_route(route):
+        """
+        Returns {city id: (latitude, longitude)} for the two cities a route links
+
+        :param route: Route Model with its stations and cities loaded
+        """
+        try:
+            return {
+                station.city.id: (float(station.city.latitude), float(station.city.longitude))
+                for station in (route.origin_station, route.destination_station)
+            }
+        except (AttributeError, TypeError):
+            return {}
+
+    @staticmethod
+    def calibrate_price_per_km(graph, coordinates):
+        """
+        Finds the lowest search cost per km of straight line distance over every edge.
+        Any journey costs at least this rate times the distance it covers, which is what
+        makes the A* heuristic admissible.
+
+        :param graph: Dict of origin city id -> list of edge dicts
+        :param coordinates: Dict of city id -> (latitude, longitude)
+        """
+        min_rate = float('inf')
+        for origin_city, edges in graph.items():
+            for edge in edges:
+                distance = great_circle_km(coordinates.get(origin_city), coordinates.get(edge["destination_city"]))
+                if distance > 0:
+                    # +2 is the per leg cost every route pays in the search
+                    min_rate = min(min_rate, (edge["price"] + 2) / distance)
+        return 0.0 if min_rate == float('inf') else min_rate
+
+    # The add/update/remove operations below keep the graph in step with writes
+    # to the routes table without a full rebuild. Searches run in other threads
+    # while this happens, so the change is made to a copy of the state which is
+    # then swapped in whole, meaning a search that already has the old state keeps
+    # a consistent copy of it. Writers are serialised with a lock so two writes
+    # can't lose each other.
+
+    def add_edge(self, route):
+        """
+        Adds a newly created route to the graph
+
+        :param self:
+        :param route: Route Model with its stations, cities and transport mode loaded
+        """
+        with self._write_lock:
+            self._write(lambda state: state.add_edge(route))
+
+    def add_edges(self, routes):
+        """
+        Adds many newly created routes as one write, so the state is copied, the CSR
+        arrays rebuilt and the shared graph published once rather than once per route
+
+        :param self:
+        :param routes: Route Models with their stations, cities and transport modes loaded
+        """
+        def apply(state):
+            for route in routes:
+                state.add_edge(route)
+
+        with self._write_lock:
+            self._write(apply)
+
+    def update_edge(self, route):
+        """
+        Replaces the edge for an updated route. The origin city may have changed so
+        the old edge is removed and the new one added.
+
+        :param self:
+        :param route: Route Model with its stations, cities and transport mode loaded
+        """
+        with self._write_lock:
+            self._write(lambda state: (state.remove_edge(route.id), state.add_edge(route)))
+
+    def remove_edge(self, route_id):
+        """
+        Removes a deleted route from the graph
+
+        :param self:
+        :param route_id: ID of the deleted route
+        """
+        with self._write_lock:
+            self._write(lambda state: state.remove_edge(route_id))
+
+    def _write(self, apply):
+        # when workers share the graph the change is made to the latest published graph
+        # and then published, so every worker sees it
+        if self.shared is not None:
+            self.shared.write(self, apply)
+        else:
+            self.swap(self.applied(apply))
+
+    def applied(self, apply):
+        """
+        Returns a copy of the current state with apply(state) run on it
+
+        :param self:
+        :param apply: Function making the change to the state it is given
+        """
+        state = self.state.copy()
+        apply(state)
+        # the CSR arrays can't be patched in place, so if that layout is in use it
+        # is rebuilt from the updated dict graph
+        if state.csr is not None:
+            state.csr = CSRGraph(state.graph)
+        return state
+
+    def graph_for(self, modes=None, reverse=False):
+        """
+        Returns the current state's adjacency list holding only edges of the given
+        transport modes, see GraphState.graph_for
+        """
+        return self.state.graph_for(modes, reverse)
+
+    def build_csr(self):
+        """
+        Builds the compact CSR copy of the current graph. Once built the journey
+        finder searches the CSR arrays instead of the dict adjacency list.
+
+        :param self:
+        """
+        # built under the write lock, otherwise a route written during the build would
+        # be missing from the CSR copy. It is built from the state it is added to, so
+        # the two always match
+        with self._write_lock:
+            state = self.state
+            state.csr = CSRGraph(state.graph)
+            return state.csr
+
+    def signature(self):
+        """
+        Returns a hash of every edge in the current graph, see GraphState.signature
+        """
+        return self.state.signature()
+
+
+EARTH_RADIUS_KM = 6371.0088
+
 
-        self.graph = new_graph
\ No newline at end of file
+def great_circle_km(a, b):
+    """
+    Haversine distance in km between two (latitude, longitude) pairs, 0 if either is unknown
+    """
+    if a is None or b is None:
+        return 0.0
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
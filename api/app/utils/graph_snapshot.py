@@ -0,0 +1,402 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from .. import models
+from .csr_graph import LEG_PENALTY_PENCE, to_pence
+from .route_catalogue import RouteCatalogue
+
+# Binary snapshot of the built graph, and the route catalogue kept with it, so a restart
+# doesn't have to load every route through the ORM. The file is a fixed header followed
+# by flat columns:
+#
+#   header   magic, format version, byte order, edge count, city count, length of the
+#            meta blob, the database stamp it was taken at and a crc32 of the rest
+#   meta     JSON of the small tables: transport modes as [id, name], city names in
+#            the same order as the city ids, stations as [id, name, city id], the
+#            distinct route notes and the A* price per km. Padded to 8 bytes
+#   cities   city ids, latitudes, longitudes (NaN if unknown), then where each city's
+#            edges start in the edge columns and in the reverse order
+#   edges    route ids, origin cities, destination cities, origin stations,
+#            destination stations and prices, sorted by origin city and then route id.
+#            Then the CSR search columns (destination city index, price + leg penalty in
+#            pence), the edge order by destination city, the edge order by route id and
+#            the route ids in that order, and each edge's notes and mode as indexes into
+#            the meta lists
+#
+# A snapshot file is read back by memory-mapping it and casting each column in place, so
+# nothing is parsed row by row. The grouping and orderings mean the columns can also be
+# searched where they are, which is how workers share one graph (see shared_graph.py).
+
+MAGIC = b"RGSN"
+FORMAT_VERSION = 3
+HEADER = struct.Struct("<4sHHIII32sI")
+LITTLE_ENDIAN = 1 if sys.byteorder == "little" else 0
+
+# edge columns that make up an edge dict, (name, array typecode)
+EDGE_COLUMNS = (
+    ("route_id", "q"),
+    ("origin_city", "q"),
+    ("destination_city", "q"),
+    ("origin_station_id", "q"),
+    ("destination_station_id", "q"),
+    ("price", "d"),
+)
+# every column in the order they are written, (name, array typecode, what it has one value per)
+LAYOUT = (
+    ("city_id", "q", "city"),
+    ("latitude", "d", "city"),
+    ("longitude", "d", "city"),
+    ("offset", "q", "offset"),          # city index -> first edge, with one extra at the end
+    ("reverse_offset", "q", "offset"),  # the same into reverse_order
+    *((name, typecode, "edge") for name, typecode in EDGE_COLUMNS),
+    ("target", "q", "edge"),            # destination city index
+    ("leg_cost", "q", "edge"),          # price + the per leg penalty, in pence
+    ("reverse_order", "q", "edge"),     # edge indexes by destination city
+    ("route_order", "q", "edge"),       # edge indexes by route id
+    ("sorted_route_id", "q", "edge"),   # route ids in route_order, to binary search
+    ("notes", "I", "edge"),
+    ("mode", "H", "edge"),
+)
+
+
+def database_stamp(db):
+    """
+    Returns a 32 byte fingerprint of the tables the graph and route catalogue are built
+    from, which changes whenever a route, station, city or transport mode is added,
+    removed or edited in a way the graph or catalogue would see.
+
+    Every write through the API or app.load_fares bumps a data_versions row in the same
+    transaction, and those rows are the real change marker. The routes are also summed
+    up with aggregate queries, each column weighted by id so two edits can't cancel out,
+    to catch most changes made straight in the database as well.
+
+    :param db: Database session
+    """
+    versions = db.execute(
+        select(models.DataVersion.kind, models.DataVersion.version).order_by(models.DataVersion.kind)
+    ).all()
+    route_totals = db.query(
+        func.count(models.Route.id),
+        func.max(models.Route.id),
+        func.sum(models.Route.id * models.Route.price),
+        func.sum(models.Route.id * models.Route.id * models.Route.price),
+        func.sum(models.Route.id * models.Route.origin_station_id),
+        func.sum(models.Route.id * models.Route.destination_station_id),
+        func.sum(models.Route.id * models.Route.transport_mode_id),
+    ).one()
+    # there are only a handful of different notes, so each is kept with the routes using it
+    notes_totals = db.execute(
+        select(
+            models.Route.notes,
+            func.count(models.Route.id),
+            func.sum(models.Route.id),
+            func.sum(models.Route.id * models.Route.id),
+        ).group_by(models.Route.notes).order_by(models.Route.notes)
+    ).all()
+
+    rows = [*versions, route_totals, *notes_totals]
+    # the snapshot holds every station, city and mode, and there are only a few
+    # hundred of them, so those rows are hashed in full
+    for query in (
+        select(models.Station.id, models.Station.city_id, models.Station.name).order_by(models.Station.id),
+        select(models.City.id, models.City.name, models.City.latitude, models.City.longitude).order_by(models.City.id),
+        select(models.TransportMode.id, models.TransportMode.name).order_by(models.TransportMode.id),
+    ):
+        rows.extend(db.execute(query))
+    # repr keeps None apart from the string "None"
+    return hashlib.sha256("\n".join(repr(tuple(row)) for row in rows).encode()).digest()
+
+
+def save_snapshot(graph_manager, path, stamp):
+    """
+    Writes the GraphManager graph to path as a binary snapshot
+
+    :param graph_manager: GraphManager with the graph built
+    :param path: File to write
+    :param stamp: database_stamp() of the data the graph was built from
+    """
+    data = snapshot_bytes(graph_manager, stamp)
+
+    # write to a temporary file first so a crash never leaves half a snapshot behind.
+    # named per process, as several workers can save the same snapshot at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def snapshot_bytes(graph_manager, stamp):
+    """
+    Returns the GraphManager graph and route catalogue in the snapshot format. The same
+    graph always gives the same bytes, whatever order its edges were added in.
+
+    :param graph_manager: GraphManager (or GraphState) with the graph and catalogue built
+    :param stamp: database_stamp() of the data the graph was built from
+    """
+    state = graph_manager.state
+    catalogue = state.catalogue or RouteCatalogue()
+    edges = sorted(
+        (edge for city_edges in state.graph.values() for edge in city_edges),
+        key=lambda edge: (edge["origin_city"], edge["route_id"])
+    )
+    records = [catalogue.routes.get(edge["route_id"], {}) for edge in edges]
+
+    modes = [[mode["id"], mode["name"]] for mode in sorted(catalogue.modes.values(), key=lambda mode: mode["id"])]
+    mode_ids = {mode_id: i for i, (mode_id, _) in enumerate(modes)}
+    mode_names = {name: i for i, (_, name) in enumerate(modes)}
+    # every edge needs a mode, even one whose name the catalogue doesn't know
+    for edge in edges:
+        if edge["transport_mode"] not in mode_names:
+            mode_names[edge["transport_mode"]] = len(modes)
+            modes.append([None, edge["transport_mode"]])
+
+    # index 0 is routes without notes
+    notes = [None] + sorted({record["notes"] for record in records if record.get("notes") is not None})
+    notes_index = {note: i for i, note in enumerate(notes)}
+
+    city_ids = sorted(
+        set(state.coordinates).union(catalogue.cities)
+        .union(edge["origin_city"] for edge in edges)
+        .union(edge["destination_city"] for edge in edges)
+    )
+    city_index = {city_id: i for i, city_id in enumerate(city_ids)}
+    meta = json.dumps({
+        "modes": modes,
+        "cities": [catalogue.cities.get(c, {}).get("name") for c in city_ids],
+        "stations": sorted([s["id"], s["name"], s["city_id"]] for s in catalogue.stations.values()),
+        "notes": notes,
+        "min_price_per_km": state.min_price_per_km,
+    }).encode()
+    meta += b" " * (-len(meta) % 8)
+
+    reverse_order = sorted(
+        range(len(edges)), key=lambda i: (edges[i]["destination_city"], edges[i]["route_id"])
+    )
+    route_order = sorted(range(len(edges)), key=lambda i: edges[i]["route_id"])
+    unknown = (float("nan"), float("nan"))
+    columns = {
+        "city_id": city_ids,
+        "latitude": (state.coordinates.get(c, unknown)[0] for c in city_ids),
+        "longitude": (state.coordinates.get(c, unknown)[1] for c in city_ids),
+        "offset": _offsets((city_index[edge["origin_city"]] for edge in edges), len(city_ids)),
+        "reverse_offset": _offsets((city_index[edges[i]["destination_city"]] for i in reverse_order), len(city_ids)),
+        "target": (city_index[edge["destination_city"]] for edge in edges),
+        "leg_cost": (to_pence(edge["price"]) + LEG_PENALTY_PENCE for edge in edges),
+        "reverse_order": reverse_order,
+        "route_order": route_order,
+        "sorted_route_id": (edges[i]["route_id"] for i in route_order),
+        "notes": (notes_index[record.get("notes")] for record in records),
+        "mode": (
+            mode_ids[record["transport_mode_id"]] if record.get("transport_mode_id") in mode_ids
+            else mode_names[edge["transport_mode"]]
+            for edge, record in zip(edges, records)
+        ),
+    }
+    for name, _ in EDGE_COLUMNS:
+        columns[name] = [edge[name] for edge in edges]
+
+    payload = [meta] + [array(typecode, columns[name]).tobytes() for name, typecode, _ in LAYOUT]
+    payload = b"".join(payload)
+    # padded so anything stored after a snapshot (see shared_graph.py) is 8 byte aligned
+    payload += bytes(-len(payload) % 8)
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, LITTLE_ENDIAN, len(edges), len(city_ids),
+        len(meta), stamp, zlib.crc32(payload)
+    )
+    return header + payload
+
+
+def _offsets(city_indexes, city_count):
+    # where each city's edges start, given the city index of every edge in order
+    offsets = [0] * (city_count + 1)
+    for i in city_indexes:
+        offsets[i + 1] += 1
+    for i in range(city_count):
+        offsets[i + 1] += offsets[i]
+    return offsets
+
+
+def load_snapshot(graph_manager, path, stamp):
+    """
+    Builds the GraphManager graph and route catalogue from the snapshot at path. Returns
+    False without touching either if the file is missing, corrupt, from another format
+    version or was taken before the latest change to the database.
+
+    :param graph_manager: The GraphManager to build
+    :param path: Snapshot file
+    :param stamp: database_stamp() of the data the graph should match
+    """
+    if not os.path.exists(path):
+        return False
+
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            edges, coordinates, catalogue = read_snapshot(mm, stamp)
+    except (OSError, ValueError, struct.error):
+        return False
+
+    if edges is None:
+        return False
+
+    graph_manager.build_graph_from_edges(edges, coordinates, catalogue)
+    return True
+
+
+def read_snapshot(buffer, stamp):
+    """
+    Reads the edges, city coordinates and route catalogue out of a snapshot held in any
+    buffer (a mmap or a shared memory block). Returns (None, None, None) if it isn't a
+    valid snapshot for stamp.
+
+    :param buffer: Object supporting the buffer protocol holding the snapshot
+    :param stamp: database_stamp() the snapshot must have been taken at, None to accept any
+    """
+    meta, columns, _ = snapshot_columns(buffer, stamp)
+    if meta is None:
+        return None, None, None
+    try:
+        values = {name: column.tolist() for name, column in columns.items()}
+    finally:
+        # the mmap or shared memory can't be closed while a view of it is still open
+        for column in columns.values():
+            column.release()
+    return snapshot_edges(meta, values)
+
+
+def snapshot_columns(buffer, stamp):
+    """
+    Checks the snapshot in buffer and returns (meta, columns, size) without copying
+    anything: columns maps each LAYOUT name to a memoryview cast to its type, and size
+    is the number of bytes the snapshot takes up. Returns (None, None, 0) if it isn't
+    a valid snapshot for stamp.
+
+    :param buffer: Object supporting the buffer protocol holding the snapshot
+    :param stamp: database_stamp() the snapshot must have been taken at, None to accept any
+    """
+    if len(buffer) < HEADER.size:
+        return None, None, 0
+    magic, format_version, little_endian, edge_count, city_count, meta_length, saved_stamp, crc = HEADER.unpack_from(buffer)
+    if magic != MAGIC or format_version != FORMAT_VERSION or little_endian != LITTLE_ENDIAN:
+        return None, None, 0
+    if stamp is not None and saved_stamp != stamp:
+        return None, None, 0
+
+    counts = {"city": city_count, "offset": city_count + 1, "edge": edge_count}
+    sizes = [array(typecode).itemsize * counts[per] for _, typecode, per in LAYOUT]
+    size = HEADER.size + meta_length + sum(sizes)
+    size += -size % 8
+
+    view = memoryview(buffer)
+    try:
+        # shared memory blocks can be rounded up to a whole page, so only the snapshot itself is checked
+        if size > len(view) or zlib.crc32(view[HEADER.size:size]) != crc:
+            return None, None, 0
+
+        offset = HEADER.size
+        meta = json.loads(bytes(view[offset:offset + meta_length]))
+        offset += meta_length
+
+        columns = {}
+        for (name, typecode, _), length in zip(LAYOUT, sizes):
+            columns[name] = view[offset:offset + length].cast(typecode)
+            offset += length
+    finally:
+        # the columns keep the buffer open themselves
+        view.release()
+    return meta, columns, size
+
+
+def snapshot_edges(meta, columns):
+    """
+    Builds (edges, coordinates, catalogue) from the meta and columns of a snapshot
+
+    :param meta: Meta dict from snapshot_columns
+    :param columns: Columns from snapshot_columns, or lists of their values
+    """
+    coordinates = snapshot_coordinates(columns)
+    catalogue = RouteCatalogue()
+    catalogue_tables(catalogue, meta, columns)
+
+    mode_names = [name for _, name in meta["modes"]]
+    edges = []
+    for i in range(len(columns["route_id"])):
+        edge = edge_at(columns, mode_names, i)
+        edges.append(edge)
+        catalogue.routes[edge["route_id"]] = route_record(columns, meta, i)
+    return edges, coordinates, catalogue
+
+
+def snapshot_coordinates(columns):
+    """
+    Returns {city id: (latitude, longitude)} for every city in a snapshot with known coordinates
+    """
+    return {
+        city_id: (lat, lon)
+        for city_id, lat, lon in zip(columns["city_id"], columns["latitude"], columns["longitude"])
+        if not math.isnan(lat)
+    }
+
+
+def catalogue_tables(catalogue, meta, columns):
+    """
+    Fills in the catalogue's cities, stations and transport modes from a snapshot. The
+    catalogue holds what the database would return, so the decimals are put back to the
+    precision of their columns.
+    """
+    for mode_id, name in meta["modes"]:
+        if mode_id is not None:
+            catalogue.modes[mode_id] = {"id": mode_id, "name": name}
+    for city_id, name, lat, lon in zip(columns["city_id"], meta["cities"], columns["latitude"], columns["longitude"]):
+        if name is not None:
+            catalogue.cities[city_id] = {
+                "id": city_id, "name": name,
+                "latitude": None if math.isnan(lat) else Decimal(f"{lat:.6f}"),
+                "longitude": None if math.isnan(lon) else Decimal(f"{lon:.6f}"),
+            }
+    for station_id, name, city_id in meta["stations"]:
+        catalogue.stations[station_id] = {"id": station_id, "name": name, "city_id": city_id}
+
+
+def edge_at(columns, mode_names, i):
+    """
+    Returns edge i of a snapshot as an edge dict
+
+    :param columns: Columns from snapshot_columns, or lists of their values
+    :param mode_names: Transport mode names in the order of the meta modes
+    :param i: Index into the edge columns
+    """
+    return {
+        "route_id": columns["route_id"][i],
+        "origin_city": columns["origin_city"][i],
+        "destination_city": columns["destination_city"][i],
+        "origin_station_id": columns["origin_station_id"][i],
+        "destination_station_id": columns["destination_station_id"][i],
+        "transport_mode": mode_names[columns["mode"][i]],
+        "price": columns["price"][i],
+    }
+
+
+def route_record(columns, meta, i):
+    """
+    Returns edge i of a snapshot as a route catalogue record
+    """
+    return {
+        "id": columns["route_id"][i],
+        "price": Decimal(f"{columns['price'][i]:.2f}"),
+        "notes": meta["notes"][columns["notes"][i]],
+        "origin_station_id": columns["origin_station_id"][i],
+        "destination_station_id": columns["destination_station_id"][i],
+        "transport_mode_id": meta["modes"][columns["mode"][i]][0],
+    }
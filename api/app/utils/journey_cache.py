@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+# LRU cache for journey search results. Keys include the graph version, so once
+# a route is written (or the graph rebuilt) the version moves on and old results
+# can never be returned again, they just fall out of the cache as it fills up.
+
+_MISSING = object()
+# default for callers to tell "not cached" apart from a cached None (no journey)
+NOT_CACHED = object()
+
+
+class JourneyCache:
+    def __init__(self, maxsize=1024, ttl=300):
+        """
+        :param maxsize: Most results to hold before the least recently used is evicted
+        :param ttl: Seconds a result stays valid for, 0 or less disables expiry
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expires_at, result)
+        self._lock = threading.Lock() # requests run in FastAPI's threadpool
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached result for key, or default if there isn't a live one
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            expires_at, result = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def set(self, key, result):
+        """
+        Stores a result, evicting the least recently used entries if full
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
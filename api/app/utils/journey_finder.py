@@ -1,12 +1,37 @@
 import heapq
+from .csr_graph import find_cheapest_path_csr
+from .fare_matrix import get_fare_matrix
+from .graph_manager import great_circle_km
 
-def find_cheapest_path(graph_manager, start_id, finish_id):
-    graph = graph_manager.graph
+ALGORITHMS = ("dijkstra", "astar", "bidirectional", "matrix")
+
+def find_cheapest_path(graph_manager, start_id, finish_id, algorithm="dijkstra", allowed_modes=None):
+    """
+    :param allowed_modes: Optional transport mode names to restrict the journey to. The search
+                          then runs over GraphManager's precomputed subgraph for those modes
+    """
+    if algorithm == "astar":
+        return find_cheapest_path_astar(graph_manager, start_id, finish_id, allowed_modes)
+    if algorithm == "bidirectional":
+        return find_cheapest_path_bidirectional(graph_manager, start_id, finish_id, allowed_modes=allowed_modes)
+    if algorithm == "matrix" and not allowed_modes:
+        # the matrix covers every mode, so filtered searches use Dijkstra over the subgraph instead
+        return get_fare_matrix(graph_manager).lookup(start_id, finish_id)
+
+    # one state for the whole search, so a write swapping in a new graph can't change it halfway
+    state = graph_manager.state
+
+    # use the compact CSR layout when it has been built (it holds every mode)
+    if state.csr is not None and not allowed_modes:
+        return find_cheapest_path_csr(state.csr, start_id, finish_id)
+
+    graph = state.graph_for(allowed_modes)
     dest_station_id = 0
     
     pq = [(0, start_id, dest_station_id, [])]
     
     cheapest_known_costs = {start_id: 0}
+    expanded = 0 # number of cities whose routes were explored
 
     while pq:
         current_cost, current_city, destination_station, path_route_ids = heapq.heappop(pq)
@@ -15,12 +40,14 @@ def find_cheapest_path(graph_manager, start_id, finish_id):
         if current_city == finish_id:
             return {
                 "total_price": current_cost - 5, # we subtract two as we will get an added £5 transfer fee for the first station
-                "route_ids": path_route_ids
+                "route_ids": path_route_ids,
+                "expanded": expanded
             }
 
         # skip more expensive routes
         if current_cost > cheapest_known_costs.get(current_city, float('inf')):
             continue
+        expanded += 1
 
         # explore all neighbours
         for edge in graph.get(current_city, []):
@@ -40,4 +67,321 @@ def find_cheapest_path(graph_manager, start_id, finish_id):
                 new_path = path_route_ids + [edge["route_id"]]
                 heapq.heappush(pq, (new_cost, next_city, edge["destination_station_id"], new_path))
 
-    return None # No path found
\ No newline at end of file
+    return None # No path found
+
+
+def find_cheapest_path_astar(graph_manager, start_id, finish_id, allowed_modes=None):
+    """
+    A* version of find_cheapest_path. Cities are expanded in order of cost so far plus
+    an estimate of the cost left, the great circle distance to the destination times
+    the cheapest price per km seen on any route. That estimate can never be more than
+    the real remaining cost, so the result is still the cheapest, but far fewer cities
+    in the wrong direction get expanded.
+    """
+    state = graph_manager.state
+    graph = state.graph_for(allowed_modes)
+    coordinates = state.coordinates
+    rate = state.min_price_per_km
+    finish_coords = coordinates.get(finish_id)
+
+    # the remaining cost estimate for each city, only worked out once
+    estimates = {}
+    def estimate(city):
+        if city not in estimates:
+            estimates[city] = rate * great_circle_km(coordinates.get(city), finish_coords)
+        return estimates[city]
+
+    pq = [(estimate(start_id), 0, start_id, 0, [])]
+    cheapest_known_costs = {start_id: 0}
+    expanded = 0
+
+    while pq:
+        _, current_cost, current_city, destination_station, path_route_ids = heapq.heappop(pq)
+
+        if current_city == finish_id:
+            return {
+                "total_price": current_cost - 5,
+                "route_ids": path_route_ids,
+                "expanded": expanded
+            }
+
+        if current_cost > cheapest_known_costs.get(current_city, float('inf')):
+            continue
+        expanded += 1
+
+        for edge in graph.get(current_city, []):
+            next_city = edge["destination_city"]
+
+            new_cost = current_cost + edge["price"] + 2
+            if edge["origin_station_id"] != destination_station:
+                new_cost += 3
+
+            if new_cost < cheapest_known_costs.get(next_city, float('inf')):
+                cheapest_known_costs[next_city] = new_cost
+                new_path = path_route_ids + [edge["route_id"]]
+                heapq.heappush(pq, (new_cost + estimate(next_city), new_cost, next_city, edge["destination_station_id"], new_path))
+
+    return None
+
+
+def find_cheapest_path_bidirectional(graph_manager, start_id, finish_id, backward=True, allowed_modes=None):
+    """
+    Bidirectional version of find_cheapest_path. One search grows forwards from the
+    origin over GraphManager.graph and another grows backwards from the destination over
+    GraphManager.reverse_graph, until they meet in the middle.
+
+    The £3 station transfer fee depends on which station you arrive at and which you
+    leave from, so both searches work on (city, station) pairs rather than just cities:
+    - forward labels are (city, station arrived at), costing everything up to that point
+    - backward labels are (city, station the rest of the trip leaves from), costing
+      everything after that point
+    Joining a forward and backward label in the same city adds the £3 fee if the two
+    stations differ. As that fee is never negative, once the cheapest forward label plus
+    the cheapest backward label costs at least the best joined journey, no unexplored
+    journey can be cheaper and the search stops.
+
+    Because it tracks stations, this can find a slightly cheaper journey than the
+    city-only searches, which keep just one arrival station per city.
+
+    :param backward: False runs only the forward half over the same labels, which is
+                     the like for like baseline the bidirectional search is measured against
+    """
+    state = graph_manager.state
+    graph = state.graph_for(allowed_modes)
+    reverse_graph = state.graph_for(allowed_modes, reverse=True)
+    no_station = 0 # not arrived at / not leaving from a station yet
+
+    def transfer_fee(arrive_station, leave_station):
+        # leaving from no station means the journey ends here. Arriving at no station means
+        # it starts here, which pays the fee just like the forward search does
+        if leave_station != no_station and arrive_station != leave_station:
+            return 3
+        return 0
+
+    start_state = (start_id, no_station)
+    finish_state = (finish_id, no_station)
+
+    forward_costs = {start_state: 0}
+    backward_costs = {finish_state: 0}
+    # city -> {station: cost}, so a new label can be joined with the other side's labels in that city
+    forward_at_city = {start_id: {no_station: 0}}
+    backward_at_city = {finish_id: {no_station: 0}}
+    forward_pred = {}  # state -> (route_id, previous state)
+    backward_succ = {} # state -> (route_id, next state)
+    forward_settled = set()
+    backward_settled = set()
+
+    forward_pq = [(0, start_id, no_station)]
+    backward_pq = [(0, finish_id, no_station)]
+
+    # best journey found so far, as (cost, forward state, backward state)
+    best = (float('inf'), None, None)
+    if start_id == finish_id:
+        best = (0, start_state, finish_state)
+
+    def join(city, station, cost, other_side, is_forward):
+        nonlocal best
+        for other_station, other_cost in other_side.get(city, {}).items():
+            if is_forward:
+                total = cost + other_cost + transfer_fee(station, other_station)
+                states = ((city, station), (city, other_station))
+            else:
+                total = cost + other_cost + transfer_fee(other_station, station)
+                states = ((city, other_station), (city, station))
+            if total < best[0]:
+                best = (total, *states)
+
+    def top(pq, settled):
+        # drop labels that are already settled so the top of the heap is a real lower bound
+        while pq and (pq[0][1], pq[0][2]) in settled:
+            heapq.heappop(pq)
+        return pq[0][0] if pq else None
+
+    while True:
+        forward_top = top(forward_pq, forward_settled)
+        backward_top = top(backward_pq, backward_settled) if backward else 0
+        if forward_top is None or backward_top is None or forward_top + backward_top >= best[0]:
+            break
+
+        # grow whichever side currently has the cheaper frontier
+        if not backward or forward_top <= backward_top:
+            cost, city, station = heapq.heappop(forward_pq)
+            forward_settled.add((city, station))
+            for edge in graph.get(city, []):
+                next_city = edge["destination_city"]
+                next_station = edge["destination_station_id"]
+                new_cost = cost + edge["price"] + 2 + transfer_fee(station, edge["origin_station_id"])
+
+                state = (next_city, next_station)
+                if new_cost < forward_costs.get(state, float('inf')):
+                    forward_costs[state] = new_cost
+                    forward_at_city.setdefault(next_city, {})[next_station] = new_cost
+                    forward_pred[state] = (edge["route_id"], (city, station))
+                    heapq.heappush(forward_pq, (new_cost, next_city, next_station))
+                    join(next_city, next_station, new_cost, backward_at_city, True)
+        else:
+            cost, city, station = heapq.heappop(backward_pq)
+            backward_settled.add((city, station))
+            for edge in reverse_graph.get(city, []):
+                prev_city = edge["origin_city"]
+                prev_station = edge["origin_station_id"]
+                new_cost = cost + edge["price"] + 2 + transfer_fee(edge["destination_station_id"], station)
+
+                state = (prev_city, prev_station)
+                if new_cost < backward_costs.get(state, float('inf')):
+                    backward_costs[state] = new_cost
+                    backward_at_city.setdefault(prev_city, {})[prev_station] = new_cost
+                    backward_succ[state] = (edge["route_id"], (city, station))
+                    heapq.heappush(backward_pq, (new_cost, prev_city, prev_station))
+                    join(prev_city, prev_station, new_cost, forward_at_city, False)
+
+    total, forward_state, backward_state = best
+    if forward_state is None:
+        return None
+
+    route_ids = []
+    state = forward_state
+    while state in forward_pred:
+        route_id, state = forward_pred[state]
+        route_ids.append(route_id)
+    route_ids.reverse()
+    state = backward_state
+    while state in backward_succ:
+        route_id, state = backward_succ[state]
+        route_ids.append(route_id)
+
+    return {
+        "total_price": total - 5,
+        "route_ids": route_ids,
+        "expanded": len(forward_settled) + len(backward_settled)
+    }
+
+
+def shortest_path_tree(graph_manager, start_id, max_price=None):
+    """
+    Runs the same search as find_cheapest_path from start_id, but carries on until
+    every reachable city is settled instead of stopping at one destination.
+
+    Returns (costs, predecessors). costs maps city -> search cost (still including the
+    £5 first station fee) and predecessors maps city -> (route_id, previous city).
+
+    :param max_price: Optional budget in pounds. The search stops as soon as the cheapest
+                      unexplored city costs more, and only cities within budget are returned
+    """
+    graph = graph_manager.state.graph
+    pq = [(0, start_id, 0)]
+    cheapest_known_costs = {start_id: 0}
+    predecessors = {}
+    max_cost = float('inf') if max_price is None else max_price + 5
+
+    while pq:
+        current_cost, current_city, destination_station = heapq.heappop(pq)
+
+        # everything left in the queue costs at least this much, so it's all over budget
+        if current_cost > max_cost:
+            break
+
+        if current_cost > cheapest_known_costs.get(current_city, float('inf')):
+            continue
+
+        for edge in graph.get(current_city, []):
+            next_city = edge["destination_city"]
+
+            new_cost = current_cost + edge["price"] + 2
+            if edge["origin_station_id"] != destination_station:
+                new_cost += 3
+
+            if new_cost < cheapest_known_costs.get(next_city, float('inf')):
+                cheapest_known_costs[next_city] = new_cost
+                predecessors[next_city] = (edge["route_id"], current_city)
+                heapq.heappush(pq, (new_cost, next_city, edge["destination_station_id"]))
+
+    if max_price is not None:
+        cheapest_known_costs = {city: cost for city, cost in cheapest_known_costs.items() if cost <= max_cost}
+    return cheapest_known_costs, predecessors
+
+
+def reverse_shortest_path_tree(graph_manager, finish_id, max_price=None):
+    """
+    The mirror of shortest_path_tree: finds the cheapest journey from every city to
+    finish_id with one search growing backwards over GraphManager.reverse_graph.
+
+    Like the backward half of find_cheapest_path_bidirectional it works on (city, station
+    the rest of the trip leaves from) labels, so an arriving route pays the £3 transfer
+    fee exactly when it comes into a different station. A city can have several labels,
+    and its cost is the cheapest of them.
+
+    Returns (costs, successors, departures). costs maps city -> search cost in the same
+    units as shortest_path_tree (including the £5 first station fee), successors maps
+    (city, station) -> (route_id, next (city, station)) and departures maps city -> the
+    station its cheapest journey leaves from, for follow_path.
+
+    :param max_price: Optional budget in pounds, as for shortest_path_tree
+    """
+    reverse_graph = graph_manager.state.reverse_graph
+    # station 0 means the journey ends here, so there is no onward station to transfer to
+    pq = [(0, finish_id, 0)]
+    cheapest_known_costs = {(finish_id, 0): 0}
+    successors = {}
+    costs = {}
+    departures = {}
+    # costs here leave out the £3 every journey pays for its first station, see below
+    max_cost = float('inf') if max_price is None else max_price + 2
+
+    while pq:
+        current_cost, current_city, departure_station = heapq.heappop(pq)
+
+        if current_cost > max_cost:
+            break
+
+        if current_cost > cheapest_known_costs.get((current_city, departure_station), float('inf')):
+            continue
+
+        # labels come off the heap cheapest first, so the first one for a city is its cheapest
+        if current_city not in departures:
+            departures[current_city] = departure_station
+            # add the £3 first station fee the forward search charges every journey
+            costs[current_city] = current_cost + 3 if current_city != finish_id else 0
+
+        for edge in reverse_graph.get(current_city, []):
+            prev_city = edge["origin_city"]
+
+            new_cost = current_cost + edge["price"] + 2
+            if departure_station != 0 and edge["destination_station_id"] != departure_station:
+                new_cost += 3
+
+            label = (prev_city, edge["origin_station_id"])
+            if new_cost < cheapest_known_costs.get(label, float('inf')):
+                cheapest_known_costs[label] = new_cost
+                successors[label] = (edge["route_id"], (current_city, departure_station))
+                heapq.heappush(pq, (new_cost, prev_city, edge["origin_station_id"]))
+
+    return costs, successors, departures
+
+
+def unwind_path(predecessors, start_id, finish_id):
+    """
+    Follows the predecessor links back from finish_id to start_id and returns the
+    route ids in travel order
+    """
+    route_ids = []
+    city = finish_id
+    while city != start_id:
+        route_id, city = predecessors[city]
+        route_ids.append(route_id)
+    route_ids.reverse()
+    return route_ids
+
+
+
+def follow_path(successors, departures, start_id, finish_id):
+    """
+    Follows the successor links from a reverse_shortest_path_tree forward from start_id
+    to finish_id and returns the route ids in travel order
+    """
+    route_ids = []
+    label = (start_id, departures[start_id])
+    while label[0] != finish_id:
+        route_id, label = successors[label]
+        route_ids.append(route_id)
+    return route_ids
@@ -0,0 +1,188 @@
+import heapq
+import threading
+from collections import OrderedDict
+
+# K cheapest loopless journeys between two cities, using Yen's algorithm over the
+# GraphManager adjacency list.
+#
+# Yen's algorithm takes each journey found so far and, for every city along it,
+# keeps the journey up to that city (the root) and searches for a new way on from
+# there (the spur) that avoids the routes already used by journeys sharing that root.
+# Two things keep that much cheaper than k separate searches:
+# - The cost and arrival station after each leg of a journey are stored, so a root's
+#   cost is a lookup rather than being re-priced for every spur.
+# - One backwards search from the destination gives, for every city, a lower bound
+#   on the cost left to get there. It is cached per destination and graph version and
+#   used as an A* estimate, so each spur search heads almost straight to the destination.
+
+_LOWER_BOUND_CACHE_SIZE = 64
+_lower_bound_cache = OrderedDict() # (graph version, destination) -> {city: lower bound}
+_lower_bound_lock = threading.Lock()
+
+
+def _lower_bounds(graph_manager, finish_id):
+    """
+    Cheapest cost from every city to finish_id counting only price + £2 per leg. Leaving
+    out the transfer fees means it never overestimates, even once routes are banned.
+    """
+    state = graph_manager.state
+    key = (state.version, finish_id)
+    with _lower_bound_lock:
+        if key in _lower_bound_cache:
+            _lower_bound_cache.move_to_end(key)
+            return _lower_bound_cache[key]
+
+    reverse_graph = state.reverse_graph
+    bounds = {finish_id: 0}
+    pq = [(0, finish_id)]
+    while pq:
+        cost, city = heapq.heappop(pq)
+        if cost > bounds[city]:
+            continue
+        for edge in reverse_graph.get(city, []):
+            prev_city = edge["origin_city"]
+            new_cost = cost + edge["price"] + 2
+            if new_cost < bounds.get(prev_city, float('inf')):
+                bounds[prev_city] = new_cost
+                heapq.heappush(pq, (new_cost, prev_city))
+
+    with _lower_bound_lock:
+        _lower_bound_cache[key] = bounds
+        if len(_lower_bound_cache) > _LOWER_BOUND_CACHE_SIZE:
+            _lower_bound_cache.popitem(last=False)
+    return bounds
+
+
+def _spur_search(graph, start_id, start_station, start_cost, finish_id, banned_routes, banned_cities, bounds):
+    """
+    A* search from start_id, having arrived at start_station, to finish_id. Uses the same
+    costs as find_cheapest_path but never takes a banned route or enters a banned city.
+
+    The £3 transfer fee depends on the station a route arrives at, so like the
+    bidirectional search this works on (city, station arrived at) labels. Keeping only
+    one label per city would lose a slightly dearer arrival that saves the fee on the
+    next leg, and then the journeys wouldn't come out cheapest first.
+
+    Returns the list of edges taken, or None if finish_id can't be reached.
+    """
+    if start_id not in bounds:
+        return None
+
+    start = (start_id, start_station)
+    pq = [(start_cost + bounds[start_id], start_cost, start_id, start_station)]
+    cheapest_known_costs = {start: start_cost}
+    predecessors = {} # label -> (edge, previous label)
+
+    while pq:
+        _, current_cost, current_city, destination_station = heapq.heappop(pq)
+        label = (current_city, destination_station)
+
+        if current_city == finish_id:
+            edges = []
+            while label != start:
+                edge, label = predecessors[label]
+                edges.append(edge)
+            edges.reverse()
+            return edges
+
+        if current_cost > cheapest_known_costs.get(label, float('inf')):
+            continue
+
+        for edge in graph.get(current_city, []):
+            next_city = edge["destination_city"]
+            # cities with no bound can't reach the destination at all
+            if next_city in banned_cities or edge["route_id"] in banned_routes or next_city not in bounds:
+                continue
+
+            new_cost = current_cost + edge["price"] + 2
+            if edge["origin_station_id"] != destination_station:
+                new_cost += 3
+
+            next_label = (next_city, edge["destination_station_id"])
+            if new_cost < cheapest_known_costs.get(next_label, float('inf')):
+                cheapest_known_costs[next_label] = new_cost
+                predecessors[next_label] = (edge, label)
+                heapq.heappush(pq, (new_cost + bounds[next_city], new_cost, next_city, edge["destination_station_id"]))
+
+    return None
+
+
+class _Journey:
+    """
+    A journey as its list of edges, with the running cost, arrival station and city
+    after every leg so roots can be reused without re-pricing them
+    """
+    def __init__(self, edges, start_id):
+        self.edges = edges
+        self.route_ids = tuple(edge["route_id"] for edge in edges)
+        self.cities = [start_id] + [edge["destination_city"] for edge in edges]
+        self.costs = [0]
+        self.stations = [0]
+        for edge in edges:
+            cost = self.costs[-1] + edge["price"] + 2
+            if edge["origin_station_id"] != self.stations[-1]:
+                cost += 3
+            self.costs.append(cost)
+            self.stations.append(edge["destination_station_id"])
+
+    @property
+    def cost(self):
+        return self.costs[-1]
+
+
+def find_k_cheapest_paths(graph_manager, start_id, finish_id, k=3):
+    """
+    Returns up to k of the cheapest journeys from start_id to finish_id, cheapest first,
+    each in the same shape as find_cheapest_path. No journey visits a city twice.
+
+    :param graph_manager: GraphManager with graph and reverse_graph built
+    :param start_id: Origin city id
+    :param finish_id: Destination city id
+    :param k: Most journeys to return
+    """
+    # the bounds and every spur search use the same state, so they agree on the graph
+    state = graph_manager.state
+    graph = state.graph
+    bounds = _lower_bounds(state, finish_id)
+
+    first = _spur_search(graph, start_id, 0, 0, finish_id, set(), set(), bounds)
+    if first is None:
+        return []
+
+    found = [_Journey(first, start_id)]
+    seen = {found[0].route_ids}
+    candidates = [] # heap of (cost, route ids, journey)
+
+    while len(found) < k:
+        previous = found[-1]
+        for i in range(len(previous.edges)):
+            root = previous.route_ids[:i]
+
+            # routes already used to leave this root by journeys we've found must be avoided
+            banned_routes = {journey.route_ids[i] for journey in found if journey.route_ids[:i] == root and len(journey.edges) > i}
+            # keep the journey loopless by never going back through the root's cities
+            banned_cities = set(previous.cities[:i])
+
+            spur = _spur_search(
+                graph, previous.cities[i], previous.stations[i], previous.costs[i],
+                finish_id, banned_routes, banned_cities, bounds
+            )
+            if spur is None:
+                continue
+
+            journey = _Journey(previous.edges[:i] + spur, start_id)
+            if journey.route_ids not in seen:
+                seen.add(journey.route_ids)
+                heapq.heappush(candidates, (journey.cost, journey.route_ids, journey))
+
+        if not candidates:
+            break
+        found.append(heapq.heappop(candidates)[2])
+
+    return [
+        {
+            "total_price": journey.cost - 5, # remove the first station fee
+            "route_ids": list(journey.route_ids)
+        }
+        for journey in found
+    ]
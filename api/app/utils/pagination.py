@@ -0,0 +1,68 @@
+from fastapi.responses import StreamingResponse
+
+from ..database import AsyncReadSessionLocal
+
+# Keyset pagination and NDJSON streaming for the list endpoints.
+#
+# Pages are asked for with ?after_id=<last id seen>&limit=<n>. Because the next page
+# starts from an id rather than an offset, every page is an index range scan on the
+# primary key however deep into the table it is. A full page sends a Link header with
+# the URL of the next one.
+#
+# Sending "Accept: application/x-ndjson" instead streams the rows one JSON object per
+# line, read from the database in batches, so a full table scan never holds more
+# than one batch in memory.
+
+NDJSON = "application/x-ndjson"
+MAX_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def wants_ndjson(request):
+    return NDJSON in request.headers.get("accept", "")
+
+
+def keyset_page(query, id_column, after_id=None, limit=None):
+    """
+    Orders the query by id and applies the page bounds
+
+    :param query: select() of the model being listed
+    :param id_column: The model's primary key column
+    :param after_id: Only return rows after this id
+    :param limit: Most rows to return, None for all of them
+    """
+    query = query.order_by(id_column)
+    if after_id is not None:
+        query = query.where(id_column > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def set_next_link(request, response, items, limit):
+    """
+    Adds a Link header pointing at the next page when this page was full
+    """
+    if limit is None or len(items) < limit:
+        return
+    next_url = request.url.include_query_params(after_id=items[-1].id, limit=limit)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+
+def ndjson_response(query, schema, headers=None):
+    """
+    Streams the rows of query as NDJSON, each one serialised with schema
+
+    :param query: select() of the rows to send, with any relationships the schema needs loaded
+    :param schema: Pydantic Read schema for one row
+    :param headers: Extra response headers
+    """
+    async def lines():
+        # the session is opened here rather than taken from the request, as the
+        # rows are still being read after the endpoint itself has returned
+        async with AsyncReadSessionLocal() as db:
+            rows = await db.stream_scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for row in rows:
+                yield schema.model_validate(row).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON, headers=headers)
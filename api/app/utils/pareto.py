@@ -0,0 +1,72 @@
+import heapq
+import itertools
+
+# Multi criteria search over (price, number of legs). Instead of folding changes into
+# the price with a fixed penalty, this finds every journey that isn't beaten on both
+# counts by another one (the Pareto frontier), e.g. £18 with 3 changes, £21 with 1
+# change and £30 direct. Price here is just the sum of the route fares.
+
+
+def find_pareto_paths(graph_manager, start_id, finish_id, max_changes=None):
+    """
+    Label setting search for the Pareto optimal journeys between two cities.
+
+    Labels are taken off the heap cheapest first (fewest legs breaking ties), so by the
+    time a label reaches a city every label already kept there is at least as cheap.
+    That means a new label is dominated exactly when one of them also has no more legs,
+    which only needs the fewest legs kept at each city. The same check against the
+    destination throws away any label that can't beat a journey already found.
+
+    Returns a list of {"total_price", "changes", "route_ids"} with the fewest changes first.
+
+    :param max_changes: Optional cap on changes. Labels with too many legs are never created,
+                        so the cap shrinks the search rather than filtering afterwards
+    """
+    graph = graph_manager.state.graph
+    max_legs = float('inf') if max_changes is None else max_changes + 1
+    fewest_legs = {} # city -> fewest legs of any label kept there
+    counter = itertools.count() # tie breaker so the heap never compares labels
+
+    # label = (price, legs, city, route_id, parent label)
+    pq = [(0, 0, next(counter), (0, 0, start_id, None, None))]
+    results = []
+
+    while pq:
+        price, legs, _, label = heapq.heappop(pq)
+        city = label[2]
+
+        if fewest_legs.get(city, float('inf')) <= legs or fewest_legs.get(finish_id, float('inf')) <= legs:
+            continue
+        fewest_legs[city] = legs
+
+        if city == finish_id:
+            results.append(label)
+            continue
+
+        if legs + 1 > max_legs:
+            continue
+
+        for edge in graph.get(city, []):
+            next_city = edge["destination_city"]
+            # anything kept at the next city or the destination is cheaper, so only fewer legs can win
+            if fewest_legs.get(next_city, float('inf')) <= legs + 1 or fewest_legs.get(finish_id, float('inf')) <= legs + 1:
+                continue
+            new_label = (price + edge["price"], legs + 1, next_city, edge["route_id"], label)
+            heapq.heappush(pq, (new_label[0], new_label[1], next(counter), new_label))
+
+    journeys = []
+    for label in results:
+        route_ids = []
+        total_price, legs = label[0], label[1]
+        while label[3] is not None:
+            route_ids.append(label[3])
+            label = label[4]
+        route_ids.reverse()
+        journeys.append({
+            "total_price": total_price,
+            "changes": max(legs - 1, 0),
+            "route_ids": route_ids
+        })
+
+    journeys.sort(key=lambda j: j["changes"])
+    return journeys
@@ -0,0 +1,118 @@
+import threading
+
+from sqlalchemy import select
+
+from .. import models
+
+# Read only copy of the route, station, city and transport mode records, kept alongside
+# the graph so /journeys can fill in each leg's details without going to the database.
+# It is always built together with the graph, from the same rows, snapshot or shared
+# memory block, and swapped in at the same time, so the two never disagree.
+# Records are plain dicts in the shape of the Read schemas. Routes only hold the ids of
+# their stations and mode and are put together when asked for, so a station or city
+# record is stored once however many routes use it.
+
+
+class RouteCatalogue:
+    def __init__(self):
+        self.cities = {}   # city id -> {id, name, latitude, longitude}
+        self.stations = {} # station id -> {id, name, city_id}
+        self.modes = {}    # transport mode id -> {id, name}
+        self.routes = {}   # route id -> {id, price, notes, origin_station_id, destination_station_id, transport_mode_id}
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def load_tables(cls, db):
+        """
+        Builds a catalogue holding every city, station and transport mode, with one column
+        only select per table. The routes are added by add_row as the graph loader streams them.
+
+        :param db: Database session
+        """
+        catalogue = cls()
+        for city_id, name, latitude, longitude in db.execute(
+            select(models.City.id, models.City.name, models.City.latitude, models.City.longitude)
+        ):
+            catalogue.cities[city_id] = {"id": city_id, "name": name, "latitude": latitude, "longitude": longitude}
+
+        for station_id, name, city_id in db.execute(
+            select(models.Station.id, models.Station.name, models.Station.city_id)
+        ):
+            catalogue.stations[station_id] = {"id": station_id, "name": name, "city_id": city_id}
+
+        for mode_id, name in db.execute(select(models.TransportMode.id, models.TransportMode.name)):
+            catalogue.modes[mode_id] = {"id": mode_id, "name": name}
+        return catalogue
+
+    def add_row(self, row):
+        """
+        Adds a route from a row of graph_loader.route_rows
+        """
+        route_id, _, _, origin, destination, _, price, notes, mode = row
+        self.routes[route_id] = {
+            "id": route_id,
+            "price": price,
+            "notes": notes,
+            "origin_station_id": origin,
+            "destination_station_id": destination,
+            "transport_mode_id": mode,
+        }
+
+    def copy(self):
+        """
+        Returns a catalogue with its own dicts holding the same records, for a graph
+        write to change without touching the catalogue searches are still reading
+        """
+        catalogue = RouteCatalogue()
+        catalogue.cities = dict(self.cities)
+        catalogue.stations = dict(self.stations)
+        catalogue.modes = dict(self.modes)
+        catalogue.routes = dict(self.routes)
+        return catalogue
+
+    def route(self, route_id):
+        """
+        Returns the route in the shape of schemas.RouteRead, or None if it isn't in the catalogue
+        """
+        route = self.routes.get(route_id)
+        if route is None:
+            return None
+        try:
+            return {
+                **route,
+                "origin_station": self.station(route["origin_station_id"]),
+                "destination_station": self.station(route["destination_station_id"]),
+                "transport_mode": self.modes[route["transport_mode_id"]],
+            }
+        except KeyError:
+            return None
+
+    def station(self, station_id):
+        station = self.stations[station_id]
+        return {**station, "city": self.cities[station["city_id"]]}
+
+    def put_route(self, route):
+        """
+        Adds or replaces a route, along with its stations, their cities and its transport mode
+
+        :param route: Route Model with its stations, cities and transport mode loaded
+        """
+        with self._write_lock:
+            for station in (route.origin_station, route.destination_station):
+                city = station.city
+                self.cities[city.id] = {"id": city.id, "name": city.name, "latitude": city.latitude, "longitude": city.longitude}
+                self.stations[station.id] = {"id": station.id, "name": station.name, "city_id": city.id}
+            mode = route.transport_mode
+            self.modes[mode.id] = {"id": mode.id, "name": mode.name}
+            self.routes[route.id] = {
+                "id": route.id,
+                "price": route.price,
+                "notes": route.notes,
+                "origin_station_id": route.origin_station_id,
+                "destination_station_id": route.destination_station_id,
+                "transport_mode_id": route.transport_mode_id,
+            }
+
+    def remove_route(self, route_id):
+        with self._write_lock:
+            self.routes.pop(route_id, None)
@@ -0,0 +1,264 @@
+import os
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from . import graph_snapshot
+from .fare_table import FareTable
+from .shared_state import SharedGraphState
+
+try:
+    import fcntl
+except ImportError: # windows, writes from different workers are then not serialised
+    fcntl = None
+
+# Lets several uvicorn/gunicorn workers share one copy of the graph. The graph, its route
+# catalogue and the fare table are published into a shared memory block in the binary
+# snapshot format, and a small control block holds the generation number of the current one:
+#
+#   <prefix>_ctl   generation (uint64) and size (uint64) of the current graph block, and
+#                  the number of workers using it (uint64)
+#   <prefix>_<n>   snapshot bytes of generation n, then the fare table if it was fresh
+#
+# The first worker to start creates the control block, builds the graph and publishes
+# generation 1. Every worker, that one included, then maps the block read only and
+# searches it in place (see shared_state.py), so the routes take the same memory however
+# many workers there are. After a route is written the worker that wrote it publishes a
+# new generation and the others pick it up on their next journey request, so a rebuild
+# is a swap of the generation number rather than a change to a block someone may be
+# reading. Each worker keeps its old mapping until its last search over it finishes.
+#
+# The last worker to shut down unlinks the blocks. A worker that is killed without
+# shutting down leaves them until the machine restarts (or /dev/shm is cleared).
+
+CONTROL = struct.Struct("<QQ")
+WORKERS = struct.Struct("<Q") # stored after CONTROL
+ATTACH_TIMEOUT = 60 # seconds to wait for the first worker to publish
+
+
+def _open_block(name, create=False, size=0):
+    block = shared_memory.SharedMemory(name=name, create=create, size=size)
+    # blocks outlive any one worker, so stop python's resource tracker from
+    # unlinking them when the worker that opened them exits
+    try:
+        resource_tracker.unregister(block._name, "shared_memory")
+    except Exception:
+        pass
+    return block
+
+
+def _map_block(name, create=False, size=0):
+    """
+    Maps a shared memory block and returns a memoryview of it. The mapping lasts as long
+    as that memoryview or any view made from it, and is unmapped by the garbage collector
+    once the last one is gone, so a search can keep using an old generation safely.
+    """
+    block = _open_block(name, create, size)
+    buffer = block.buf
+    # hand the mapping over to the memoryview, so closing the block only closes its file
+    block._buf = None
+    block._mmap = None
+    block.close()
+    return buffer
+
+
+class SharedGraph:
+    def __init__(self, prefix):
+        """
+        :param self:
+        :param prefix: Name the shared memory blocks start with
+        """
+        self.prefix = prefix
+        self.generation = 0
+        self._control = None # the control block, mapped while this worker is attached
+        self._sync_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._lock_path = os.path.join(tempfile.gettempdir(), f"{prefix}.lock")
+
+    def _published(self):
+        return CONTROL.unpack_from(self._control)[0]
+
+    def attach(self, graph_manager, stamp):
+        """
+        Swaps in the published graph. Returns False if this worker has to load the graph
+        itself, either because it is the first worker or the published graph is from
+        before the latest change to the database.
+
+        :param self:
+        :param graph_manager: The GraphManager to update
+        :param stamp: graph_snapshot.database_stamp() the graph must match
+        """
+        with self._process_lock():
+            try:
+                self._control = _map_block(f"{self.prefix}_ctl", create=True, size=CONTROL.size + WORKERS.size)
+                CONTROL.pack_into(self._control, 0, 0, 0)
+                WORKERS.pack_into(self._control, CONTROL.size, 1)
+                # we created it, so we are the loader
+                return False
+            except FileExistsError:
+                self._control = _map_block(f"{self.prefix}_ctl")
+                workers, = WORKERS.unpack_from(self._control, CONTROL.size)
+                WORKERS.pack_into(self._control, CONTROL.size, workers + 1)
+
+        # another worker is the loader, wait for its first generation
+        deadline = time.monotonic() + ATTACH_TIMEOUT
+        generation = self._published()
+        while generation == 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+            generation = self._published()
+
+        return generation != 0 and self._load(graph_manager, generation, stamp)
+
+    def detach(self):
+        """
+        Stops this worker using the shared graph. The last worker to detach unlinks the
+        blocks, so nothing is left in shared memory once every worker has shut down.
+
+        :param self:
+        """
+        if self._control is None:
+            return
+        with self._process_lock():
+            workers, = WORKERS.unpack_from(self._control, CONTROL.size)
+            workers = max(workers - 1, 0)
+            WORKERS.pack_into(self._control, CONTROL.size, workers)
+            if workers == 0:
+                generation = self._published()
+                if generation:
+                    self._unlink(f"{self.prefix}_{generation}")
+                self._unlink(f"{self.prefix}_ctl")
+        self._control.release()
+        self._control = None
+
+    def sync(self, graph_manager):
+        """
+        Swaps in the published graph if another worker has published a newer generation.
+        Cheap enough to run on every request, it reads 8 bytes of the control block this
+        worker already has mapped.
+
+        :param self:
+        :param graph_manager: The GraphManager to update
+        """
+        if self._control is None:
+            return False
+        generation = self._published()
+        if generation == self.generation:
+            return False
+
+        # the write lock first, in the same order as write() takes them, so a write in
+        # this worker can't be lost under a graph swapped in while it was running
+        with graph_manager._write_lock, self._sync_lock:
+            if generation == self.generation:
+                return False
+            return self._load(graph_manager, generation, None)
+
+    def _load(self, graph_manager, generation, stamp):
+        try:
+            buffer = _map_block(f"{self.prefix}_{generation}")
+        except FileNotFoundError:
+            return False
+
+        state = SharedGraphState.from_buffer(buffer, stamp)
+        if state is None:
+            return False
+        # the route catalogue comes with the graph, so journey legs match the graph they were found in
+        graph_manager.swap(state)
+        # the fare table is only published with the graph it was built from, so it is fresh for it
+        graph_manager.fare_table = FareTable.from_buffer(buffer[state.size:], state.version)
+        self.generation = generation
+        return True
+
+    def publish(self, graph_manager, stamp, fare_table=None):
+        """
+        Publishes the GraphManager graph as a new generation for the other workers, and
+        swaps this worker over to searching the published copy too
+
+        :param self:
+        :param graph_manager: GraphManager with the graph built
+        :param stamp: graph_snapshot.database_stamp() of the data the graph was built from
+        :param fare_table: FareTable built from the same graph, published along with it
+        """
+        with graph_manager._write_lock, self._process_lock():
+            generation = self._publish(graph_manager.state, stamp, fare_table)
+            return self._load(graph_manager, generation, None)
+
+    def _publish(self, state, stamp, fare_table=None):
+        data = graph_snapshot.snapshot_bytes(state, stamp)
+        if fare_table is not None:
+            data += fare_table.to_bytes()
+        previous = self._published()
+        generation = previous + 1
+
+        block = _map_block(f"{self.prefix}_{generation}", create=True, size=len(data))
+        block[:len(data)] = data
+        block.release()
+
+        # switching the generation is the swap, readers never see a half written graph
+        CONTROL.pack_into(self._control, 0, generation, len(data))
+
+        # workers still holding the old block keep their mapping, this only removes its name
+        if previous:
+            self._unlink(f"{self.prefix}_{previous}")
+        return generation
+
+    def write(self, graph_manager, apply):
+        """
+        Runs apply() against a copy of the latest published graph and publishes the result,
+        holding a lock shared by every worker so two workers' writes can't lose each other
+
+        :param self:
+        :param graph_manager: The GraphManager being written to
+        :param apply: Function making the change to the GraphState it is given
+        """
+        from ..database import SessionLocal
+
+        with self._process_lock():
+            self.sync(graph_manager)
+            # the change is made to a dict copy, which is only kept until it is published
+            state = graph_manager.applied(apply)
+
+            db = SessionLocal()
+            try:
+                stamp = graph_snapshot.database_stamp(db)
+            finally:
+                db.close()
+            generation = self._publish(state, stamp)
+            self._load(graph_manager, generation, None)
+
+    @staticmethod
+    def _unlink(name):
+        try:
+            block = shared_memory.SharedMemory(name=name)
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _process_lock(self):
+        return _FileLock(self._lock_path, self._publish_lock)
+
+
+class _FileLock:
+    """
+    Thread lock plus an flock on a file, so it is held across processes too
+    """
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.file = open(self.path, "a")
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
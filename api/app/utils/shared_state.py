@@ -0,0 +1,228 @@
+import hashlib
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from .csr_graph import CSRGraph
+from .graph_manager import GraphState
+from .graph_snapshot import (
+    HEADER, catalogue_tables, edge_at, route_record, snapshot_columns, snapshot_coordinates, snapshot_edges
+)
+from .route_catalogue import RouteCatalogue
+
+# A GraphState that reads the graph straight out of a snapshot in shared memory instead
+# of holding its own dicts. The adjacency lists, reverse index, route origins and route
+# catalogue records are read only views that build each edge dict or record from the
+# columns when a search asks for it, and the CSR search runs over the columns directly.
+# Only what grows with the number of cities (coordinates, city and station records and
+# the city index) is copied into the worker, so memory for the routes is paid once
+# however many workers there are.
+#
+# Nothing is cached per worker, so the dict based searches (mode filters, A*,
+# bidirectional, k cheapest, Pareto) are slower than over a GraphState of dicts.
+# Unfiltered Dijkstra searches use the CSR columns and are as fast as GRAPH_LAYOUT=csr.
+
+
+class SharedGraphState(GraphState):
+    def __init__(self, meta, columns, size, payload):
+        """
+        :param self:
+        :param meta: Meta dict from graph_snapshot.snapshot_columns
+        :param columns: Columns from graph_snapshot.snapshot_columns
+        :param size: Bytes the snapshot takes up, anything stored after it starts here
+        :param payload: memoryview of the snapshot after its header
+        """
+        self.meta = meta
+        self.payload = payload
+        self.columns = columns
+        self.size = size
+        self.city_index = {city_id: i for i, city_id in enumerate(columns["city_id"])}
+        self.mode_names = [name for _, name in meta["modes"]]
+
+        self.graph = _Adjacency(self, reverse=False)
+        self.reverse_graph = _Adjacency(self, reverse=True)
+        self.mode_graphs = {name: _Adjacency(self, False, {i}) for i, name in enumerate(self.mode_names)}
+        self.mode_reverse_graphs = {name: _Adjacency(self, True, {i}) for i, name in enumerate(self.mode_names)}
+        self._mode_graph_cache = {}
+        self.route_origins = _RouteOrigins(columns)
+        self.coordinates = snapshot_coordinates(columns)
+        self.min_price_per_km = meta["min_price_per_km"]
+        self.catalogue = SharedCatalogue(meta, columns)
+        self.csr = CSRGraph.from_columns(
+            columns["city_id"], columns["offset"], columns["target"], columns["origin_station_id"],
+            columns["destination_station_id"], columns["route_id"], columns["leg_cost"]
+        )
+        self.version = 0
+        self._digest = None
+
+    @classmethod
+    def from_buffer(cls, buffer, stamp):
+        """
+        Returns a state over the snapshot in buffer, or None if it isn't a valid snapshot for stamp
+
+        :param buffer: memoryview of the shared memory block
+        :param stamp: graph_snapshot.database_stamp() it must match, None to accept any
+        """
+        meta, columns, size = snapshot_columns(buffer, stamp)
+        if meta is None:
+            return None
+        return cls(meta, columns, size, buffer[HEADER.size:size])
+
+    def copy(self):
+        """
+        Returns a GraphState of ordinary dicts holding the same graph, for a write to
+        change before it is published as a new shared graph
+
+        :param self:
+        """
+        state = GraphState.from_edges(*snapshot_edges(self.meta, self.columns))
+        state.version = self.version
+        return state
+
+    def digest(self):
+        """
+        Hash of the graph and route catalogue, see GraphState.digest. The published
+        snapshot already holds them in the same bytes, so it is hashed directly.
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.payload).hexdigest()
+        return self._digest
+
+    def graph_for(self, modes=None, reverse=False):
+        """
+        Returns a view of the edges of the given transport modes, see GraphState.graph_for.
+        The mode of each edge is checked as it is read rather than merged up front.
+        """
+        full = self.reverse_graph if reverse else self.graph
+        if not modes:
+            return full
+
+        modes = frozenset(modes)
+        indexes = frozenset(i for i, name in enumerate(self.mode_names) if name in modes)
+        if len(indexes) == len(self.mode_names):
+            return full
+
+        key = (modes, reverse)
+        view = self._mode_graph_cache.get(key)
+        if view is None:
+            view = _Adjacency(self, reverse, indexes)
+            self._mode_graph_cache[key] = view
+        return view
+
+
+class _Adjacency(Mapping):
+    """
+    city id -> list of edge dicts leaving (or for the reverse index, arriving at) that
+    city, built from the snapshot columns each time a city is looked up
+    """
+    def __init__(self, state, reverse, modes=None):
+        columns = state.columns
+        self.columns = columns
+        self.city_ids = columns["city_id"]
+        self.city_index = state.city_index
+        self.mode_names = state.mode_names
+        self.offsets = columns["reverse_offset" if reverse else "offset"]
+        self.order = columns["reverse_order"] if reverse else None
+        self.modes = modes # mode indexes to keep, None for every mode
+        self._cities = None
+
+    def get(self, city, default=None):
+        i = self.city_index.get(city)
+        if i is None:
+            return default
+        lo = self.offsets[i]
+        hi = self.offsets[i + 1]
+        if lo == hi:
+            return default
+
+        columns = self.columns
+        mode_column = columns["mode"]
+        edges = []
+        for e in (range(lo, hi) if self.order is None else self.order[lo:hi]):
+            if self.modes is None or mode_column[e] in self.modes:
+                edges.append(edge_at(columns, self.mode_names, e))
+        return edges or default
+
+    def __getitem__(self, city):
+        edges = self.get(city)
+        if edges is None:
+            raise KeyError(city)
+        return edges
+
+    def __contains__(self, city):
+        return self.get(city) is not None
+
+    def __iter__(self):
+        # worked out once, it is one entry per city
+        if self._cities is None:
+            if self.modes is None:
+                self._cities = [
+                    city_id for i, city_id in enumerate(self.city_ids) if self.offsets[i] != self.offsets[i + 1]
+                ]
+            else:
+                self._cities = [city_id for city_id in self.city_ids if city_id in self]
+        return iter(self._cities)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def _edge_index(columns, route_id):
+    # binary search of the route ids, so a route is found without an index per worker
+    route_ids = columns["sorted_route_id"]
+    k = bisect_left(route_ids, route_id)
+    if k < len(route_ids) and route_ids[k] == route_id:
+        return columns["route_order"][k]
+    return None
+
+
+class _RouteOrigins(Mapping):
+    """
+    route id -> origin city id
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, route_id):
+        e = _edge_index(self.columns, route_id)
+        if e is None:
+            raise KeyError(route_id)
+        return self.columns["origin_city"][e]
+
+    def __iter__(self):
+        return iter(self.columns["sorted_route_id"])
+
+    def __len__(self):
+        return len(self.columns["sorted_route_id"])
+
+
+class _RouteRecords(_RouteOrigins):
+    """
+    route id -> route catalogue record
+    """
+    def __init__(self, columns, meta):
+        super().__init__(columns)
+        self.meta = meta
+
+    def __getitem__(self, route_id):
+        e = _edge_index(self.columns, route_id)
+        if e is None:
+            raise KeyError(route_id)
+        return route_record(self.columns, self.meta, e)
+
+
+class SharedCatalogue(RouteCatalogue):
+    """
+    Route catalogue whose route records are read from the shared snapshot
+    """
+    def __init__(self, meta, columns):
+        super().__init__()
+        catalogue_tables(self, meta, columns)
+        self.routes = _RouteRecords(columns, meta)
+
+    def put_route(self, route):
+        # the shared graph is read only, a route written since it was published
+        # is in the next generation and until then comes from the database
+        pass
+
+    def remove_route(self, route_id):
+        pass
@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.graph_manager import GraphManager
+from app.utils.journey_finder import find_cheapest_path
+from benchmarks.common import DEFAULT_DB, load_routes, synthetic_routes, random_pairs, queries_per_second
+
+"""
+Compares plain Dijkstra with the geographic A* search: cities expanded, queries/sec
+and a check that both return the same price.
+
+Usage (from the api directory):
+    python -m benchmarks.astar
+    python -m benchmarks.astar --synthetic 2000
+"""
+
+
+def city_id(routes, name):
+    for route in routes:
+        if route.origin_station.city.name == name:
+            return route.origin_station.city.id
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--synthetic", type=int, default=0, help="number of cities in a generated network")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    routes = synthetic_routes(args.synthetic) if args.synthetic else load_routes(args.db)
+    gm = GraphManager()
+    gm.build_graph(routes)
+    print(f"routes: {len(routes)}  min price per km: £{gm.min_price_per_km:.4f}")
+
+    # the long north to south trip A* should help most with
+    aberdeen, plymouth = city_id(routes, "aberdeen"), city_id(routes, "plymouth")
+    if aberdeen and plymouth:
+        dijkstra = find_cheapest_path(gm, aberdeen, plymouth, "dijkstra")
+        astar = find_cheapest_path(gm, aberdeen, plymouth, "astar")
+        if dijkstra and astar:
+            print(f"aberdeen -> plymouth: £{dijkstra['total_price']:.2f} vs £{astar['total_price']:.2f}, "
+                  f"expanded {dijkstra['expanded']} vs {astar['expanded']} cities")
+
+    pairs = random_pairs(gm.graph.keys(), args.queries)
+    print(f"{'algorithm':<10}{'avg expanded':>14}{'queries/sec':>14}")
+    results = {}
+    for algorithm in ("dijkstra", "astar"):
+        qps, found = queries_per_second(lambda a, b: find_cheapest_path(gm, a, b, algorithm), pairs)
+        found = [r for r in found if r]
+        results[algorithm] = found
+        avg = sum(r["expanded"] for r in found) / max(len(found), 1)
+        print(f"{algorithm:<10}{avg:>14.1f}{qps:>14.0f}")
+
+    mismatches = sum(
+        1 for d, a in zip(results["dijkstra"], results["astar"])
+        if abs(d["total_price"] - a["total_price"]) > 0.005
+    )
+    print(f"price mismatches: {mismatches}/{len(results['dijkstra'])}")
+
+
+if __name__ == "__main__":
+    main()
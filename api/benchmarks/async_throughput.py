@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+Concurrent request throughput of the async endpoints against the blocking versions
+they replaced. Requests go straight to the ASGI app in process (needs httpx), so
+the numbers are the framework and database layers without any network in between.
+
+Usage (from the api directory):
+    python -m benchmarks.async_throughput                       # test.db
+    python -m benchmarks.async_throughput --concurrency 100  # more requests than the threadpool has threads
+    python -m benchmarks.async_throughput --url postgresql://...  # a real database
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", default="sqlite:///test.db", help="DATABASE_URL to run against")
+parser.add_argument("--requests", type=int, default=2000)
+parser.add_argument("--concurrency", type=int, default=20)
+args = parser.parse_args()
+
+# the app reads its settings on import, so point it at the benchmark database first.
+# the supabase client only has to be created, logins are skipped below
+os.environ["DATABASE_URL"] = args.url
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_ANON_KEY", "unused.unused.unused")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "unused")
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy.orm import Session
+from types import SimpleNamespace
+
+from app import models, schemas
+from app.database import get_db
+from app.routers import routes, stations
+from app.utils.verify_auth_token import get_current_user
+
+
+def admin_user():
+    return SimpleNamespace(user_metadata={"role": "admin"})
+
+
+def blocking_app():
+    """
+    The station and route lookups as they were before the async layer
+    """
+    app = FastAPI()
+
+    @app.get("/stations/{station_id}", response_model=schemas.StationRead)
+    def get_station_by_id(station_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+        station = db.query(models.Station).filter(models.Station.id == station_id).first()
+        if not station:
+            raise HTTPException(status_code=404, detail="Station not found")
+        return station
+
+    @app.get("/routes/{route_id}", response_model=schemas.RouteRead)
+    def get_route_by_id(route_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+        route = db.query(models.Route).filter(models.Route.id == route_id).first()
+        if not route:
+            raise HTTPException(status_code=404, detail="Route not found")
+        return route
+
+    return app
+
+
+def async_app():
+    app = FastAPI()
+    app.include_router(stations.router)
+    app.include_router(routes.router)
+    return app
+
+
+async def run(app, urls, concurrency):
+    """
+    Sends every url with at most concurrency requests in flight.
+    Returns (successful requests/sec, failed requests).
+    """
+    app.dependency_overrides[get_current_user] = admin_user
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    queue = list(urls)
+    failed = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def worker():
+            nonlocal failed
+            while queue:
+                response = await client.get(queue.pop())
+                if response.status_code != 200:
+                    failed += 1
+
+        # one warm up request so connection setup isn't timed
+        await client.get(urls[0])
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return (len(urls) - failed) / (time.perf_counter() - start), failed
+
+
+def main():
+    rng = random.Random(0)
+    with next(get_db()) as db:
+        station_ids = [row[0] for row in db.query(models.Station.id)]
+        route_ids = [row[0] for row in db.query(models.Route.id)]
+
+    urls = [
+        f"/stations/{rng.choice(station_ids)}" if i % 2 else f"/routes/{rng.choice(route_ids)}"
+        for i in range(args.requests)
+    ]
+
+    blocking = asyncio.run(run(blocking_app(), urls, args.concurrency))
+    non_blocking = asyncio.run(run(async_app(), urls, args.concurrency))
+
+    print(f"{args.requests} requests, {args.concurrency} in flight")
+    print(f"{'endpoints':<12}{'requests/sec':>14}{'failed':>8}")
+    print(f"{'blocking':<12}{blocking[0]:>14.0f}{blocking[1]:>8}")
+    print(f"{'async':<12}{non_blocking[0]:>14.0f}{non_blocking[1]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.graph_manager import GraphManager
+from app.utils.journey_finder import find_cheapest_path, find_cheapest_path_bidirectional
+from benchmarks.common import DEFAULT_DB, load_routes, synthetic_routes, random_pairs, queries_per_second
+
+"""
+Compares the current forward Dijkstra with the bidirectional search.
+
+The bidirectional search settles (city, station) labels, so it is measured against a
+forward only run over the same labels as well as against the city only Dijkstra.
+
+Usage (from the api directory):
+    python -m benchmarks.bidirectional
+    python -m benchmarks.bidirectional --synthetic 2000
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--synthetic", type=int, default=0, help="number of cities in a generated network")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    routes = synthetic_routes(args.synthetic) if args.synthetic else load_routes(args.db)
+    gm = GraphManager()
+    gm.build_graph(routes)
+    pairs = random_pairs(gm.graph.keys(), args.queries)
+
+    searches = {
+        "dijkstra (cities)": lambda a, b: find_cheapest_path(gm, a, b, "dijkstra"),
+        "forward (stations)": lambda a, b: find_cheapest_path_bidirectional(gm, a, b, backward=False),
+        "bidirectional": lambda a, b: find_cheapest_path_bidirectional(gm, a, b),
+    }
+
+    print(f"routes: {len(routes)}  queries: {len(pairs)}")
+    print(f"{'search':<20}{'avg settled':>14}{'queries/sec':>14}")
+    results = {}
+    for name, search in searches.items():
+        qps, found = queries_per_second(search, pairs)
+        results[name] = found
+        reached = [r for r in found if r]
+        avg = sum(r["expanded"] for r in reached) / max(len(reached), 1)
+        print(f"{name:<20}{avg:>14.1f}{qps:>14.0f}")
+
+    mismatches = cheaper = 0
+    for f, b, d in zip(results["forward (stations)"], results["bidirectional"], results["dijkstra (cities)"]):
+        if f and abs(f["total_price"] - b["total_price"]) > 0.005:
+            mismatches += 1
+        if d and b["total_price"] < d["total_price"] - 0.005:
+            cheaper += 1
+    print(f"bidirectional vs forward price mismatches: {mismatches}/{len(pairs)}")
+    print(f"journeys cheaper than the city only search (better station choice): {cheaper}/{len(pairs)}")
+
+
+if __name__ == "__main__":
+    main()
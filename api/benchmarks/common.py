@@ -0,0 +1,113 @@
+import math
+import random
+import sqlite3
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+# Shared helpers for the benchmark scripts. Routes are loaded straight from a
+# sqlite database (or generated) as light objects shaped like models.Route, so
+# the benchmarks don't need the API settings or a running server.
+
+DEFAULT_DB = "test.db"
+
+
+def load_routes(db_path=DEFAULT_DB):
+    """
+    Loads every route from a sqlite database as Route shaped objects
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cities = {
+            row[0]: SimpleNamespace(id=row[0], name=row[1], latitude=Decimal(str(row[2])), longitude=Decimal(str(row[3])))
+            for row in conn.execute("SELECT id, name, latitude, longitude FROM cities")
+        }
+        stations = {
+            row[0]: SimpleNamespace(id=row[0], name=row[1], city=cities[row[2]])
+            for row in conn.execute("SELECT id, name, city_id FROM stations")
+        }
+        modes = {
+            row[0]: SimpleNamespace(id=row[0], name=row[1])
+            for row in conn.execute("SELECT id, name FROM transport_modes")
+        }
+        routes = [
+            SimpleNamespace(
+                id=row[0],
+                price=Decimal(str(row[1])),
+                origin_station=stations[row[2]],
+                destination_station=stations[row[3]],
+                transport_mode=modes[row[4]],
+            )
+            for row in conn.execute(
+                "SELECT id, price, origin_station_id, destination_station_id, transport_mode_id FROM routes"
+            )
+        ]
+    finally:
+        conn.close()
+    return routes
+
+
+def synthetic_routes(num_cities, routes_per_city=20, stations_per_city=2, seed=0):
+    """
+    Generates a random network of cities spread over a UK sized box. Each city
+    links to its nearest neighbours with a price roughly proportional to distance.
+    """
+    rng = random.Random(seed)
+    modes = [SimpleNamespace(id=1, name="coach"), SimpleNamespace(id=2, name="train")]
+    cities = [
+        SimpleNamespace(
+            id=i + 1,
+            name=f"city {i + 1}",
+            latitude=Decimal(str(round(rng.uniform(50.0, 58.5), 6))),
+            longitude=Decimal(str(round(rng.uniform(-5.5, 1.7), 6))),
+        )
+        for i in range(num_cities)
+    ]
+    stations = {
+        city.id: [SimpleNamespace(id=city.id * stations_per_city + s, name=f"station {s}", city=city) for s in range(stations_per_city)]
+        for city in cities
+    }
+
+    def dist(a, b):
+        return math.hypot(float(a.latitude - b.latitude), float(a.longitude - b.longitude))
+
+    routes = []
+    route_id = 1
+    for city in cities:
+        # mostly nearby cities, with a few long distance links
+        by_distance = sorted((c for c in cities if c is not city), key=lambda c: dist(city, c))
+        neighbours = by_distance[:routes_per_city - 2] + rng.sample(by_distance, min(2, len(by_distance)))
+        for other in neighbours:
+            price = 3 + dist(city, other) * rng.uniform(8, 20)
+            routes.append(SimpleNamespace(
+                id=route_id,
+                price=Decimal(str(round(price, 2))),
+                origin_station=rng.choice(stations[city.id]),
+                destination_station=rng.choice(stations[other.id]),
+                transport_mode=rng.choice(modes),
+            ))
+            route_id += 1
+    return routes
+
+
+def random_pairs(city_ids, count, seed=1):
+    """
+    Picks random (origin, destination) city pairs
+    """
+    rng = random.Random(seed)
+    city_ids = list(city_ids)
+    pairs = []
+    while len(pairs) < count:
+        a, b = rng.sample(city_ids, 2)
+        pairs.append((a, b))
+    return pairs
+
+
+def queries_per_second(search, pairs):
+    """
+    Runs search(origin, destination) over every pair and returns (queries/sec, results)
+    """
+    start = time.perf_counter()
+    results = [search(a, b) for a, b in pairs]
+    elapsed = time.perf_counter() - start
+    return len(pairs) / elapsed, results
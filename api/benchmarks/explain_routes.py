@@ -0,0 +1,124 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+Checks the GET /routes/ filters (and the other lookups the indexes were added for)
+are answered from an index, by running EXPLAIN on the SQL they generate. Exits with
+status 1 if any query falls back to scanning its table.
+
+On sqlite test.db is copied and migrated to the latest revision first. A --url
+database is explained as it is, so run `alembic upgrade head` on it beforehand.
+
+Usage (from the api directory):
+    python -m benchmarks.explain_routes                          # copy of test.db
+    python -m benchmarks.explain_routes --url postgresql://...   # a real database
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", help="DATABASE_URL to explain against, default a migrated copy of test.db")
+parser.add_argument("--db", default="test.db")
+args = parser.parse_args()
+
+url = args.url
+if url is None:
+    path = os.path.join(tempfile.mkdtemp(), "explain.db")
+    shutil.copy(args.db, path)
+    url = f"sqlite:///{path}"
+
+# the app (and alembic's env.py) read the settings on import.
+# the supabase client only has to be created, nothing here logs in
+os.environ["DATABASE_URL"] = url
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_ANON_KEY", "unused.unused.unused")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "unused")
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, select, text
+
+from app import models
+from app.routers.routes import filter_routes
+
+# the unique (city_id, name) constraint's index serves lookups by city. sqlite doesn't
+# name the index behind a constraint, it is the first automatic index on the table
+STATION_CITY_INDEXES = {"uq_stations_city_id_name", "sqlite_autoindex_stations_1"}
+
+def queries(conn):
+    """
+    (description, select(), index names any of which should be used) for each lookup.
+    Ids are taken from the database so the plans are for values that exist.
+    """
+    origin, destination = conn.execute(
+        select(models.Route.origin_station_id, models.Route.destination_station_id).limit(1)
+    ).one()
+    origin_city = conn.scalar(select(models.Station.city_id).where(models.Station.id == origin))
+    destination_city = conn.scalar(select(models.Station.city_id).where(models.Station.id == destination))
+    city_name = conn.scalar(select(models.City.name).where(models.City.id == origin_city))
+    mode = conn.scalar(select(models.TransportMode.id).limit(1))
+    routes = select(models.Route)
+
+    return [
+        ("routes between two cities",
+         filter_routes(routes, origin_city_id=origin_city, destination_city_id=destination_city),
+         {*STATION_CITY_INDEXES, "ix_routes_origin_destination", "ix_routes_destination_station_id"}),
+        ("routes from a city",
+         filter_routes(routes, origin_city_id=origin_city),
+         {*STATION_CITY_INDEXES, "ix_routes_origin_destination"}),
+        ("routes from a station",
+         filter_routes(routes, origin_station_id=origin),
+         {"ix_routes_origin_destination"}),
+        ("routes between two stations",
+         filter_routes(routes, origin_station_id=origin, destination_station_id=destination),
+         {"ix_routes_origin_destination"}),
+        ("routes to a station",
+         filter_routes(routes, destination_station_id=destination),
+         {"ix_routes_destination_station_id"}),
+        ("routes by transport mode",
+         filter_routes(routes, transport_mode_id=mode, max_price=50),
+         {"ix_routes_transport_mode_id"}),
+        ("stations in a city",
+         select(models.Station).where(models.Station.city_id == origin_city),
+         STATION_CITY_INDEXES),
+        ("city by name",
+         select(models.City).where(models.City.name == city_name),
+         {"ix_cities_name"}),
+    ]
+
+
+def explain(conn, query):
+    sql = str(query.compile(conn.engine, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return "\n".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    return "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN {sql}")))
+
+
+def main():
+    if args.url is None:
+        command.upgrade(Config("alembic.ini"), "head")
+
+    engine = create_engine(url)
+    failed = 0
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # with only a few thousand rows postgres prefers reading the whole table, this
+            # checks the indexes can be used for when the tables grow
+            conn.execute(text("SET enable_seqscan = off"))
+
+        for description, query, expected in queries(conn):
+            plan = explain(conn, query)
+            used = sorted(name for name in expected if name in plan)
+            failed += not used
+            print(f"{'ok ' if used else 'NO INDEX'} {description}: {', '.join(used) or '-'}")
+            print("    " + plan.replace("\n", "\n    "))
+
+    print(f"{failed} queries without an index" if failed else "every lookup uses an index")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
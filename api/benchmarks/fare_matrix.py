@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.graph_manager import GraphManager
+from app.utils.journey_finder import find_cheapest_path, shortest_path_tree
+from app.utils.fare_matrix import FareMatrix
+from benchmarks.common import synthetic_routes, random_pairs
+
+"""
+Time to work out every cheapest fare with the NumPy Floyd-Warshall engine, compared
+with repeated Python searches, as the synthetic network grows.
+
+Running the Python searches for every pair takes far too long on big networks, so
+they are timed on a sample and scaled up to all pairs.
+
+Usage (from the api directory):
+    python -m benchmarks.fare_matrix
+    python -m benchmarks.fare_matrix --sizes 200 500 1000 2000 4000
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 500, 1000, 2000])
+    parser.add_argument("--stations-per-city", type=int, default=1)
+    parser.add_argument("--sample", type=int, default=20, help="searches timed per size to estimate the all pairs time")
+    args = parser.parse_args()
+
+    print(f"{'cities':>7}{'stations':>10}{'matrix (s)':>12}{'trees (s)':>12}{'pairwise (s)':>14}{'x faster':>10}")
+    for size in args.sizes:
+        gm = GraphManager()
+        gm.build_graph(synthetic_routes(size, stations_per_city=args.stations_per_city))
+
+        start = time.perf_counter()
+        matrix = FareMatrix(gm)
+        matrix_seconds = time.perf_counter() - start
+
+        # one full search per origin city
+        origins = list(gm.graph)[:args.sample]
+        start = time.perf_counter()
+        for origin in origins:
+            shortest_path_tree(gm, origin)
+        tree_seconds = (time.perf_counter() - start) / len(origins) * len(gm.graph)
+
+        # find_cheapest_path for every origin/destination pair
+        pairs = random_pairs(gm.graph.keys(), args.sample)
+        start = time.perf_counter()
+        for a, b in pairs:
+            find_cheapest_path(gm, a, b)
+        pairwise_seconds = (time.perf_counter() - start) / len(pairs) * len(gm.graph) * (len(gm.graph) - 1)
+
+        print(f"{size:>7}{len(matrix.station_ids):>10}{matrix_seconds:>12.2f}{tree_seconds:>12.2f}"
+              f"{pairwise_seconds:>14.1f}{pairwise_seconds / matrix_seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.graph_manager import GraphManager
+from app.utils.journey_finder import find_cheapest_path
+from app.utils.csr_graph import find_cheapest_path_csr
+from benchmarks.common import DEFAULT_DB, load_routes, synthetic_routes, random_pairs, queries_per_second
+
+"""
+Compares the dict adjacency list with the CSR array layout.
+
+Usage (from the api directory):
+    python -m benchmarks.graph_layout                  # routes from test.db
+    python -m benchmarks.graph_layout --synthetic 2000 # generated network
+"""
+
+
+def traced(fn):
+    """
+    Runs fn and returns (result, bytes allocated and still alive afterwards)
+    """
+    tracemalloc.start()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--synthetic", type=int, default=0, help="number of cities in a generated network")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    routes = synthetic_routes(args.synthetic) if args.synthetic else load_routes(args.db)
+
+    gm = GraphManager()
+    _, dict_bytes = traced(lambda: gm.build_graph(routes))
+    dict_graph = gm.graph
+
+    # search the dict layout first, then build the CSR copy
+    pairs = random_pairs(gm.graph.keys(), args.queries)
+    dict_qps, dict_results = queries_per_second(lambda a, b: find_cheapest_path(gm, a, b), pairs)
+
+    csr, csr_bytes = traced(gm.build_csr)
+    csr_qps, csr_results = queries_per_second(lambda a, b: find_cheapest_path_csr(csr, a, b), pairs)
+
+    mismatches = sum(
+        1 for d, c in zip(dict_results, csr_results)
+        if (d is None) != (c is None) or (d and abs(d["total_price"] - c["total_price"]) > 0.005)
+    )
+
+    print(f"routes: {len(routes)}  cities: {csr.num_cities}  edges: {csr.num_edges}")
+    print(f"{'layout':<8}{'memory (KiB)':>14}{'queries/sec':>14}")
+    print(f"{'dict':<8}{dict_bytes / 1024:>14.0f}{dict_qps:>14.0f}")
+    print(f"{'csr':<8}{csr_bytes / 1024:>14.0f}{csr_qps:>14.0f}")
+    print(f"csr arrays alone: {csr.nbytes() / 1024:.0f} KiB, speed up x{csr_qps / dict_qps:.1f}")
+    print(f"price mismatches: {mismatches}/{len(pairs)}")
+    del dict_graph
+
+
+if __name__ == "__main__":
+    main()
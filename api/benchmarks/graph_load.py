@@ -0,0 +1,106 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.models pulls in the settings, which only need to exist for these imports
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY"):
+    os.environ.setdefault(name, "unused")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, joinedload
+
+from app import models
+from app.utils.graph_manager import GraphManager
+from app.utils.graph_loader import load_graph
+from benchmarks.common import DEFAULT_DB
+
+"""
+Compares loading the graph through full ORM models (the old startup) with the
+column only streaming loader.
+
+Usage (from the api directory):
+    python -m benchmarks.graph_load            # routes from test.db
+    python -m benchmarks.graph_load --scale 10 # test.db with every route copied 10 times
+"""
+
+
+def scaled_copy(db_path, scale):
+    """
+    Copies the database to a temporary file with every route repeated scale times
+    """
+    path = os.path.join(tempfile.mkdtemp(), "scaled.db")
+    shutil.copy(db_path, path)
+    conn = sqlite3.connect(path)
+    try:
+        (max_id,) = conn.execute("SELECT MAX(id) FROM routes").fetchone()
+        for i in range(1, scale):
+            # nudge the prices so the copies aren't identical
+            conn.execute(
+                "INSERT INTO routes (price, notes, origin_station_id, destination_station_id, transport_mode_id) "
+                "SELECT price + ?, notes, origin_station_id, destination_station_id, transport_mode_id "
+                "FROM routes WHERE id <= ?",
+                (i / 100, max_id)
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def orm_load(gm, db):
+    routes = db.query(models.Route).options(
+        joinedload(models.Route.origin_station).joinedload(models.Station.city),
+        joinedload(models.Route.destination_station).joinedload(models.Station.city),
+        joinedload(models.Route.transport_mode)
+    ).all()
+    gm.build_graph(routes)
+
+
+def measure(loader, engine):
+    """
+    Runs loader(gm, db) and returns (seconds, peak traced memory in bytes, graph signature).
+    Timing and memory come from separate runs as tracing slows python down.
+    """
+    gm = GraphManager()
+    with Session(engine) as db:
+        start = time.perf_counter()
+        loader(gm, db)
+        elapsed = time.perf_counter() - start
+
+    with Session(engine) as db:
+        tracemalloc.start()
+        loader(gm, db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, gm.signature(), len(gm.route_origins)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--scale", type=int, default=1, help="copies of the route table to load")
+    args = parser.parse_args()
+
+    path = scaled_copy(args.db, args.scale) if args.scale > 1 else args.db
+    engine = create_engine(f"sqlite:///{path}")
+
+    orm_time, orm_peak, orm_signature, routes = measure(orm_load, engine)
+    rows_time, rows_peak, rows_signature, _ = measure(load_graph, engine)
+
+    print(f"routes: {routes}")
+    print(f"{'loader':<10}{'seconds':>10}{'peak memory (MiB)':>20}")
+    print(f"{'orm':<10}{orm_time:>10.2f}{orm_peak / 2**20:>20.1f}")
+    print(f"{'rows':<10}{rows_time:>10.2f}{rows_peak / 2**20:>20.1f}")
+    print(f"speed up x{orm_time / rows_time:.1f}, same graph: {orm_signature == rows_signature}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.graph_manager import GraphManager
+from app.utils.journey_finder import find_cheapest_path
+from app.utils.k_shortest import find_k_cheapest_paths
+from benchmarks.common import DEFAULT_DB, load_routes, synthetic_routes, random_pairs, queries_per_second
+
+"""
+Latency of the k cheapest journeys search as k grows, compared with a single
+find_cheapest_path call. Also checks every query's journeys come back cheapest
+first, and exits with status 1 if any don't.
+
+Usage (from the api directory):
+    python -m benchmarks.k_shortest
+    python -m benchmarks.k_shortest --synthetic 2000
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--synthetic", type=int, default=0, help="number of cities in a generated network")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    routes = synthetic_routes(args.synthetic) if args.synthetic else load_routes(args.db)
+    gm = GraphManager()
+    gm.build_graph(routes)
+    pairs = random_pairs(gm.graph.keys(), args.queries)
+
+    qps, _ = queries_per_second(lambda a, b: find_cheapest_path(gm, a, b), pairs)
+    single_ms = 1000 / qps
+    print(f"routes: {len(routes)}  queries: {len(pairs)}")
+    print(f"find_cheapest_path: {single_ms:.2f} ms")
+    print(f"{'k':>3}{'ms/query':>12}{'x single':>12}{'avg found':>12}")
+
+    out_of_order = []
+    for k in (1, 2, 3, 5, 10):
+        start = time.perf_counter()
+        found = [find_k_cheapest_paths(gm, a, b, k) for a, b in pairs]
+        ms = (time.perf_counter() - start) * 1000 / len(pairs)
+        avg_found = sum(len(f) for f in found) / len(found)
+        print(f"{k:>3}{ms:>12.2f}{ms / single_ms:>12.1f}{avg_found:>12.1f}")
+
+        for (a, b), journeys in zip(pairs, found):
+            prices = [journey["total_price"] for journey in journeys]
+            if any(later < earlier - 1e-9 for earlier, later in zip(prices, prices[1:])):
+                out_of_order.append((a, b, k, [round(price, 2) for price in prices]))
+
+    for a, b, k, prices in out_of_order:
+        print(f"out of order: {a} -> {b} k={k}: {prices}")
+    print(f"{len(out_of_order)} queries not cheapest first" if out_of_order else "every query came back cheapest first")
+    sys.exit(1 if out_of_order else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the shared graph pulls in the settings, which only need to exist for these imports
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY"):
+    os.environ.setdefault(name, "unused")
+
+from app.utils.fare_table import FareTable
+from app.utils.graph_manager import GraphManager
+from app.utils.shared_graph import SharedGraph
+from benchmarks.common import DEFAULT_DB, load_routes, synthetic_routes
+
+"""
+Memory each worker uses for the graph and fare table when it builds its own copy,
+compared with attaching to one published in shared memory (GRAPH_SHARED_MEMORY).
+Memory is the worker's private pages from /proc, so this only runs on Linux.
+
+Usage (from the api directory):
+    python -m benchmarks.shared_graph
+    python -m benchmarks.shared_graph --synthetic 1000 --workers 8
+"""
+
+def private_kib():
+    total = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean", "Private_Dirty")):
+                total += int(line.split()[1])
+    return total
+
+
+def worker(args, prefix, results):
+    # loaded by both kinds of worker and kept until the end, so only the graph is measured
+    routes = synthetic_routes(args.synthetic) if args.synthetic else load_routes(args.db)
+    gm = GraphManager()
+    gc.collect()
+    before = private_kib()
+
+    if prefix:
+        shared = SharedGraph(prefix)
+        shared.attach(gm, None)
+    else:
+        gm.build_graph(routes)
+        gm.fare_table = FareTable().build(gm)
+    # run a search so the pages it touches are counted too
+    gm.fare_table.lookup(*list(gm.graph)[:2])
+
+    gc.collect()
+    results.put(private_kib() - before)
+    if prefix:
+        shared.detach()
+
+
+def run(args, prefix=None):
+    # spawned rather than forked, so workers don't share the parent's pages
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(args, prefix, results)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    used = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(used) / len(used) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--synthetic", type=int, default=0, help="number of cities in a generated network")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    routes = synthetic_routes(args.synthetic) if args.synthetic else load_routes(args.db)
+    gm = GraphManager()
+    gm.build_graph(routes)
+    prefix = f"rgbench{os.getpid()}"
+    shared = SharedGraph(prefix)
+    shared.attach(gm, None)
+    shared.publish(gm, bytes(32), FareTable().build(gm))
+    block_mib = os.path.getsize(f"/dev/shm/{prefix}_{shared.generation}") / 1024 / 1024
+
+    try:
+        own = run(args)
+        attached = run(args, prefix)
+    finally:
+        shared.detach()
+
+    print(f"routes: {len(routes)}  workers: {args.workers}  shared block: {block_mib:.1f} MiB")
+    print(f"{'':>10}{'MiB/worker':>12}{'total MiB':>12}")
+    print(f"{'own copy':>10}{own:>12.1f}{own * args.workers:>12.1f}")
+    print(f"{'shared':>10}{attached:>12.1f}{attached * args.workers + block_mib:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import pandas as pd
 
 BASE_URL = "http://127.0.0.1:8000"
 TRANSPORT_MODE_ID = 1  # Set to 1 for coach
+BATCH_SIZE = 5000 # routes sent per POST /routes/bulk request
+STATION_BATCH_SIZE = 5000 # stations sent per POST /stations/bulk_upsert request
 
 # 1. Fetch lookups once to minimize API calls
 def get_city_lookup():
@@ -14,39 +16,30 @@ def get_city_lookup():
         print(f"Error fetching cities: {e}")
         return {}
 
-def get_station_lookup():
-    try:
-        resp = requests.get(f"{BASE_URL}/stations/")
-        resp.raise_for_status()
-        # Key by (city_id, station_name) to be unique across the DB
-        return {(s['city_id'], s['name'].lower()): s['id'] for s in resp.json()}
-    except Exception as e:
-        print(f"Error fetching stations: {e}")
-        return {}
-
 # Initialize local caches
 city_lookup = get_city_lookup()
-station_lookup = get_station_lookup()
-
-def resolve_station(name, city_id):
-    name = name.lower().strip()
-    key = (city_id, name)
-    
-    if key in station_lookup:
-        return station_lookup[key]
-    
-    # RESTful POST to create a new station resource if it doesn't exist
-    print(f"Creating station: '{name}' in City ID: {city_id}")
-    payload = {"name": name, "city_id": city_id}
-    try:
-        r = requests.post(f"{BASE_URL}/stations/", json=payload)
-        r.raise_for_status()
-        new_id = r.json()["id"]
-        station_lookup[key] = new_id 
-        return new_id
-    except Exception as e:
-        print(f"Failed to create station {name}: {e}")
-        return None
+
+# Stations are all resolved at once after reading the CSV, the server creates
+# any that are missing and only ever makes one station per (city, name)
+def resolve_stations(keys):
+    """Gets or creates every (city_id, name) station with POST /stations/bulk_upsert and returns their ids."""
+    lookup = {}
+    keys = list(keys)
+    for start in range(0, len(keys), STATION_BATCH_SIZE):
+        batch = [{"city_id": city_id, "name": name} for city_id, name in keys[start:start + STATION_BATCH_SIZE]]
+        try:
+            r = requests.post(f"{BASE_URL}/stations/bulk_upsert", json=batch, timeout=60)
+            r.raise_for_status()
+        except Exception as e:
+            print(f"Error resolving stations: {e}")
+            continue
+        result = r.json()
+        for error in result["errors"]:
+            print(f"Error: {error['detail']}")
+        for station in result["stations"]:
+            if station:
+                lookup[(station["city_id"], station["name"])] = station["id"]
+    return lookup
 
 # --- Main Execution ---
 
@@ -56,8 +49,9 @@ df = pd.read_csv('extracted_fares.csv')
 # Format: origin_city,destination_city,origin_station,destination_station,price
 data = df.to_dict(orient='records')
 
-print(f"Starting upload of {len(data)} routes...")
+print(f"Resolving stations for {len(data)} routes...")
 
+records = []
 for record in data:
     # 1. Extract and normalize names from the CSV record
     o_city_name = str(record["origin_city"]).lower().strip()
@@ -75,9 +69,15 @@ for record in data:
         print(f"Skipping: City '{missing}' not found in database lookup.")
         continue
 
-    # 3. Resolve Station IDs
-    o_stat_id = resolve_station(o_stat_name, o_city_id)
-    d_stat_id = resolve_station(d_stat_name, d_city_id)
+    records.append(((o_city_id, o_stat_name), (d_city_id, d_stat_name), price))
+
+# 3. Resolve Station IDs, in a few requests for the whole file
+station_lookup = resolve_stations({key for o_key, d_key, _ in records for key in (o_key, d_key)})
+
+routes = []
+for o_key, d_key, price in records:
+    o_stat_id = station_lookup.get(o_key)
+    d_stat_id = station_lookup.get(d_key)
 
     if o_stat_id and d_stat_id:
         # 4. Construct Route Payload
@@ -89,14 +89,22 @@ for record in data:
             "notes": "Flix Bus route"
         }
 
-        # 5. POST the Route
-        try:
-            res = requests.post(f"{BASE_URL}/routes/", json=route_payload)
-            if res.status_code in [200, 201]:
-                print(f"Route Created: {o_stat_name} -> {d_stat_name} (£{price})")
-            else:
-                print("ERROR", res.status_code, res.text)
-        except Exception as e:
-            print(f"Error posting route: {e}")
+        routes.append(route_payload)
+
+# 5. POST the Routes in batches, each one is inserted in a single transaction
+print(f"Uploading {len(routes)} routes in batches of {BATCH_SIZE}...")
+for start in range(0, len(routes), BATCH_SIZE):
+    batch = routes[start:start + BATCH_SIZE]
+    try:
+        res = requests.post(f"{BASE_URL}/routes/bulk", json=batch, timeout=120)
+        if res.status_code != 200:
+            print("ERROR", res.status_code, res.text)
+            continue
+        result = res.json()
+        for error in result["errors"]:
+            print("ERROR", error["detail"], batch[error["index"]])
+        print(f"Routes Created: {len(result['created'])} of {len(batch)}")
+    except Exception as e:
+        print(f"Error posting routes: {e}")
 
 print("Upload process complete.") #24291
\ No newline at end of file
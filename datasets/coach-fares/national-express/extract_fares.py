@@ -193,21 +193,18 @@ pprint.pprint(list(unique_fairs.values()), width=120)
 import requests
 
 BASE_URL = "http://127.0.0.1:8000"
+BATCH_SIZE = 5000 # routes sent per POST /routes/bulk request
+STATION_BATCH_SIZE = 5000 # stations sent per POST /stations/bulk_upsert request
 
 # 1. Fetch all cities once at the start to get their IDs
 def get_city_lookup():
     resp = requests.get(f"{BASE_URL}/city/")
     return {c['name'].lower(): c['id'] for c in resp.json()}
 
-# 2. Fetch all stations to avoid creating duplicates
-def get_station_lookup():
-    resp = requests.get(f"{BASE_URL}/stations/")
-    # Key by (city_id, station_name) to be unique across the whole DB
-    return {(s['city_id'], s['name'].lower()): s['id'] for s in resp.json()}
-
 city_lookup = get_city_lookup()
-station_lookup = get_station_lookup()
 
+# 2. Pair each fare with its stations' (city_id, name)
+fares = []
 for fare in unique_fairs.values():
     # Normalize names
     o_city = fare["origin_city_name"].lower()
@@ -222,35 +219,44 @@ for fare in unique_fairs.values():
     if not o_city_id or not d_city_id:
         print(f"Skipping: City {o_city if not o_city_id else d_city} not found in DB.")
         continue
-
-    # get or create station
-    def resolve_station(name, city_id):
-        key = (city_id, name)
-        if key in station_lookup:
-            return station_lookup[key]
-        
-        # RESTful POST to create a new station resource
-        print(f"Creating station: {name}")
-        payload = {"name": name, "city_id": city_id}
-        r = requests.post(f"{BASE_URL}/stations/", json=payload)
-        new_id = r.json()["id"]
-        station_lookup[key] = new_id 
-        return new_id
-
-    o_stat_id = resolve_station(o_stat, o_city_id)
-    d_stat_id = resolve_station(d_stat, d_city_id)
-
-    route_payload = {
-        "origin_station_id": o_stat_id,
-        "destination_station_id": d_stat_id,
+    fares.append((fare, (o_city_id, o_stat), (d_city_id, d_stat)))
+
+# 3. Get or create every station in batches, the server only makes one station per (city, name)
+stations = list({key for _, o_key, d_key in fares for key in (o_key, d_key)})
+station_lookup = {}
+for start in range(0, len(stations), STATION_BATCH_SIZE):
+    batch = [{"city_id": city_id, "name": name} for city_id, name in stations[start:start + STATION_BATCH_SIZE]]
+    r = requests.post(f"{BASE_URL}/stations/bulk_upsert", json=batch, timeout=60)
+    if r.status_code != 200:
+        print("ERROR", r.status_code, r.text)
+        continue
+    result = r.json()
+    for error in result["errors"]:
+        print("ERROR", error["detail"], batch[error["index"]])
+    station_lookup.update({(s["city_id"], s["name"]): s["id"] for s in result["stations"] if s})
+
+# 4. Create the routes in batches, each one is inserted in a single transaction
+route_payloads = []
+for fare, o_key, d_key in fares:
+    if o_key not in station_lookup or d_key not in station_lookup:
+        print(f"Skipping: station {o_key if o_key not in station_lookup else d_key} could not be created.")
+        continue
+    route_payloads.append({
+        "origin_station_id": station_lookup[o_key],
+        "destination_station_id": station_lookup[d_key],
         "price": fare["price"],
         "transport_mode_id": 1, 
         "notes": "National Express Bus"
-    }
-
-    #print(route_payload)
-    
-    res = requests.post(f"{BASE_URL}/routes/", json=route_payload)
-    if res.status_code == 200 or res.status_code == 201:
-        print(f"Route Created: {o_stat} -> {d_stat} (£{fare['price']})")
-    
\ No newline at end of file
+    })
+
+print(f"Uploading {len(route_payloads)} routes in batches of {BATCH_SIZE}...")
+for start in range(0, len(route_payloads), BATCH_SIZE):
+    batch = route_payloads[start:start + BATCH_SIZE]
+    res = requests.post(f"{BASE_URL}/routes/bulk", json=batch, timeout=120)
+    if res.status_code != 200:
+        print("ERROR", res.status_code, res.text)
+        continue
+    result = res.json()
+    print(f"Routes Created: {len(result['created'])} of {len(batch)}")
+    for error in result["errors"]:
+        print("ERROR", error["detail"], batch[error["index"]])
@@ -1,11 +1,11 @@
 import requests
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- CONFIG ---
 BASE_URL = "http://127.0.0.1:8000"
 TRANSPORT_MODE_ID = 2
-MAX_WORKERS = 15  
+BATCH_SIZE = 5000 # routes sent per POST /routes/bulk request
+STATION_BATCH_SIZE = 5000 # stations sent per POST /stations/bulk_upsert request
 
 # --- LOOKUP LOGIC ---
 def get_city_lookup():
@@ -17,52 +17,50 @@ def get_city_lookup():
         print(f"Error fetching cities: {e}")
         return {}
 
-def get_station_lookup():
-    try:
-        resp = requests.get(f"{BASE_URL}/stations/")
-        resp.raise_for_status()
-        return {(s['city_id'], s['name'].lower()): s['id'] for s in resp.json()}
-    except Exception as e:
-        print(f"Error fetching stations: {e}")
-        return {}
-
 city_lookup = get_city_lookup()
-station_lookup = get_station_lookup()
 
-def resolve_station(name, city_id):
-    name = name.lower().strip()
-    key = (city_id, name)
-    
-    if key in station_lookup:
-        return station_lookup[key]
-    
-
-    payload = {"name": name, "city_id": city_id}
-    try:
-        r = requests.post(f"{BASE_URL}/stations/", json=payload)
-        r.raise_for_status()
-        new_id = r.json()["id"]
-        station_lookup[key] = new_id 
-        return new_id
-    except Exception as e:
-        return None
+# every station is resolved up front in a few requests, and as the server
+# only creates a (city, name) station once there are no duplicates
+def resolve_stations(keys):
+    """Gets or creates every (city_id, name) station with POST /stations/bulk_upsert and returns their ids."""
+    lookup = {}
+    keys = list(keys)
+    for start in range(0, len(keys), STATION_BATCH_SIZE):
+        batch = [{"city_id": city_id, "name": name} for city_id, name in keys[start:start + STATION_BATCH_SIZE]]
+        try:
+            r = requests.post(f"{BASE_URL}/stations/bulk_upsert", json=batch, timeout=60)
+            r.raise_for_status()
+        except Exception as e:
+            print(f"Error resolving stations: {e}")
+            continue
+        result = r.json()
+        for error in result["errors"]:
+            print(f"Error: {error['detail']}")
+        for station in result["stations"]:
+            if station:
+                lookup[(station["city_id"], station["name"])] = station["id"]
+    return lookup
 
-# --- WORKER FUNCTION ---
-def upload_route(record):
-    """Function executed by each thread."""
+# --- ROUTE BUILDING ---
+def station_keys(record):
+    """Returns the (city_id, name) of a CSV record's origin and destination stations, or an error message."""
     o_city_name = str(record["origin_city"]).lower().strip()
     d_city_name = str(record["destination_city"]).lower().strip()
     o_stat_name = str(record["origin_station"]).lower().strip()
     d_stat_name = str(record["destination_station"]).lower().strip()
-    
+
     o_city_id = city_lookup.get(o_city_name)
     d_city_id = city_lookup.get(d_city_name)
 
     if not o_city_id or not d_city_id:
-        return f"Skip: City not found for {o_city_name} or {d_city_name}"
+        return None, f"Skip: City not found for {o_city_name} or {d_city_name}"
+    return ((o_city_id, o_stat_name), (d_city_id, d_stat_name)), None
 
-    o_stat_id = resolve_station(o_stat_name, o_city_id)
-    d_stat_id = resolve_station(d_stat_name, d_city_id)
+def build_route(record, keys, station_lookup):
+    """Returns the route payload for a CSV record, or an error message if it can't be resolved."""
+    (_, o_stat_name), (_, d_stat_name) = keys
+    o_stat_id = station_lookup.get(keys[0])
+    d_stat_id = station_lookup.get(keys[1])
 
     if o_stat_id and d_stat_id:
         payload = {
@@ -72,30 +70,49 @@ def upload_route(record):
             "transport_mode_id": TRANSPORT_MODE_ID,
             "notes": "Imported from Rail Fares Dataset"
         }
-        try:
-            res = requests.post(f"{BASE_URL}/routes/", json=payload, timeout=10)
-            if res.status_code in [200, 201]:
-                return f"Success: {o_stat_name} -> {d_stat_name}"
-            return f"Error {res.status_code}: {o_stat_name} -> {d_stat_name}"
-        except Exception as e:
-            return f"Request Failed: {e}"
-    return f"Failed to resolve stations for {o_stat_name}/{d_stat_name}"
+        return payload, None
+    return None, f"Failed to resolve stations for {o_stat_name}/{d_stat_name}"
 
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
     df = pd.read_csv('extracted_fares2.csv')
     data = df.to_dict(orient='records')
-    
-    print(f"Starting parallel upload of {len(data)} routes using {MAX_WORKERS} workers...")
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Map the upload function to our data
-        futures = [executor.submit(upload_route, record) for record in data]
-        
-        for i, future in enumerate(as_completed(futures)):
-            result = future.result()
-            # Print status every 10 records to avoid flooding the console
-            if i % 10 == 0 or "Error" in result:
-                print(f"[{i}/{len(data)}] {result}")
+    records = []
+    for record in data:
+        keys, error = station_keys(record)
+        if error:
+            print(error)
+        else:
+            records.append((record, keys))
+
+    unique_stations = {key for _, keys in records for key in keys}
+    print(f"Resolving {len(unique_stations)} stations...")
+    station_lookup = resolve_stations(unique_stations)
+
+    routes = []
+    for record, keys in records:
+        payload, error = build_route(record, keys, station_lookup)
+        if error:
+            print(error)
+        else:
+            routes.append(payload)
+
+    # the whole batch is checked and inserted in one transaction on the server,
+    # which is far quicker than one request (and commit) per route
+    print(f"Uploading {len(routes)} of {len(data)} routes in batches of {BATCH_SIZE}...")
+    for start in range(0, len(routes), BATCH_SIZE):
+        batch = routes[start:start + BATCH_SIZE]
+        try:
+            res = requests.post(f"{BASE_URL}/routes/bulk", json=batch, timeout=120)
+            res.raise_for_status()
+        except Exception as e:
+            print(f"Request Failed for routes {start}-{start + len(batch)}: {e}")
+            continue
+        result = res.json()
+        for error in result["errors"]:
+            route = batch[error["index"]]
+            print(f"Error: {error['detail']} for {route['origin_station_id']} -> {route['destination_station_id']}")
+        print(f"[{start + len(batch)}/{len(routes)}] created {len(result['created'])} routes")
 
     print("Upload process complete.")
\ No newline at end of file